@@ -3,8 +3,15 @@ import os,sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from datetime import datetime
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from shared.config import DB_PATH
+from shared.raw_store import (
+    ensure_raw_schema, list_partitions, drop_partitions_before, hours_back,
+    partitions_for_range, union_source
+)
 
 RAW_RETENTION_HOURS = 48
 RUN_VACUUM = True
@@ -27,92 +34,234 @@ def open_db():
 
 def ensure_schema(conn: sqlite3.Connection):
     cur = conn.cursor()
-    cur.execute('''CREATE TABLE IF NOT EXISTS live_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date_time TEXT,
-        temp REAL,
-        hum REAL,
-        lux REAL,
-        gas_pct REAL,
-        press REAL,
-        device_id INTEGER
-    )''')
-    
+    ensure_raw_schema(conn)
+
+    cur.execute(f"CREATE TABLE IF NOT EXISTS minute_history (time_label TEXT NOT NULL, {HOURLY_COLS}, PRIMARY KEY(time_label, device_id))")
     cur.execute(f"CREATE TABLE IF NOT EXISTS hourly_history (time_label TEXT NOT NULL, {HOURLY_COLS}, PRIMARY KEY(time_label, device_id))")
     cur.execute(f"CREATE TABLE IF NOT EXISTS daily_history (time_label TEXT NOT NULL, {HOURLY_COLS}, PRIMARY KEY(time_label, device_id))")
 
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_live_data_datetime ON live_data(date_time)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_hourly_time ON hourly_history(time_label)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_daily_time ON daily_history(time_label)")
 
     conn.commit()
 
-def repair_hourly(conn: sqlite3.Connection) -> int:
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT OR REPLACE INTO hourly_history (
-          time_label,
-          device_id,
-          temp_min, temp_max, temp_avg,
-          hum_min, hum_max, hum_avg,
-          lux_min, lux_max, lux_avg,
-          gas_min, gas_max, gas_avg,
-          press_min, press_max, press_avg,
-          sample_count
+# --- Chunked, resumable repair ---
+#
+# Each chunk is aggregated on its own read connection (optionally in a
+# thread pool) and written back in one short transaction together with the
+# job's progress marker, so an interrupted repair resumes at the last chunk.
+
+RAW_ROLLUP_SELECT = """
+    SELECT
+      strftime('{bucket}', date_time) AS hr,
+      device_id,
+      MIN(temp), MAX(temp), AVG(temp),
+      MIN(hum), MAX(hum), AVG(hum),
+      MIN(lux), MAX(lux), AVG(lux),
+      MIN(gas_pct), MAX(gas_pct), AVG(gas_pct),
+      MIN(press), MAX(press), AVG(press),
+      COUNT(*)
+    FROM {source}
+    WHERE date_time >= ? AND date_time < ? {device_filter}
+    GROUP BY hr, device_id
+    HAVING COUNT(*) > 0
+"""
+
+DAILY_SELECT = """
+    SELECT
+      strftime('%Y-%m-%d', time_label) AS dy,
+      device_id,
+      MIN(temp_min), MAX(temp_max), AVG(temp_avg),
+      MIN(hum_min), MAX(hum_max), AVG(hum_avg),
+      MIN(lux_min), MAX(lux_max), AVG(lux_avg),
+      MIN(gas_min), MAX(gas_max), AVG(gas_avg),
+      MIN(press_min), MAX(press_max), AVG(press_avg),
+      SUM(sample_count)
+    FROM {source}
+    WHERE time_label >= ? AND time_label < ? {device_filter}
+    GROUP BY dy, device_id
+    HAVING SUM(sample_count) > 0
+"""
+
+UPSERT = """
+    INSERT OR REPLACE INTO {table} (
+      time_label,
+      device_id,
+      temp_min, temp_max, temp_avg,
+      hum_min, hum_max, hum_avg,
+      lux_min, lux_max, lux_avg,
+      gas_min, gas_max, gas_avg,
+      press_min, press_max, press_avg,
+      sample_count
+    ) VALUES ({marks})
+"""
+
+TIERS = {
+    # tier: (target table, source select, chunk alignment in hours)
+    "minute": ("minute_history", RAW_ROLLUP_SELECT.replace("{bucket}", "%Y-%m-%d %H:%M:00"), 1),
+    "hourly": ("hourly_history", RAW_ROLLUP_SELECT.replace("{bucket}", "%Y-%m-%d %H:00:00"), 1),
+    "daily": ("daily_history", DAILY_SELECT, 24),
+}
+
+def ensure_progress_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS repair_progress (
+            job TEXT PRIMARY KEY,
+            done_until TEXT NOT NULL,
+            chunks_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            range_since TEXT,
+            range_until TEXT
         )
-        SELECT
-          strftime('%Y-%m-%d %H:00:00', date_time) AS hr,
-          device_id,
-          MIN(temp), MAX(temp), AVG(temp),
-          MIN(hum), MAX(hum), AVG(hum),
-          MIN(lux), MAX(lux), AVG(lux),
-          MIN(gas_pct), MAX(gas_pct), AVG(gas_pct),
-          MIN(press), MAX(press), AVG(press),
-          COUNT(*)
-        FROM live_data
-        WHERE date_time < datetime('now','start of hour')
-        GROUP BY hr, device_id
-        HAVING COUNT(*) > 0
     """)
     conn.commit()
 
-    cur.execute("""
+def job_key(tier: str, since: datetime = None, until: datetime = None, devices=()) -> str:
+    """
+    Identifies a repair by what the user asked for. Defaulted bounds move
+    between runs (oldest row, current hour), so they are not part of the key.
+    """
+    return "|".join((tier, _fmt(since) if since else "*", _fmt(until) if until else "*",
+                     ",".join(map(str, devices))))
+
+def _fmt(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+def _floor(dt: datetime, bucket_hours: int) -> datetime:
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if bucket_hours == 24 else dt
+
+def _device_filter(devices) -> tuple:
+    if not devices:
+        return "", ()
+    return f"AND device_id IN ({','.join('?' * len(devices))})", tuple(devices)
+
+def _source_bounds(conn: sqlite3.Connection, tier: str) -> tuple:
+    if tier in ("minute", "hourly"):
+        row = conn.execute("SELECT MIN(date_time), MAX(date_time) FROM live_data").fetchone()
+    else:
+        row = conn.execute("SELECT MIN(time_label), MAX(time_label) FROM hourly_history").fetchone()
+    if not row[0]:
+        return None, None
+    return datetime.fromisoformat(row[0]), datetime.fromisoformat(row[1])
+
+def plan_chunks(since: datetime, until: datetime, chunk_hours: int, bucket_hours: int) -> list:
+    """Splits [since, until) into bucket-aligned (start, end) chunks."""
+    step = timedelta(hours=max(bucket_hours, chunk_hours - chunk_hours % bucket_hours))
+    chunks = []
+    start = _floor(since, bucket_hours)
+    while start < until:
+        chunks.append((start, min(start + step, until)))
+        start += step
+    return chunks
+
+def read_chunk(tier: str, start: datetime, end: datetime, devices) -> list:
+    """Aggregates one chunk on a private read connection (thread safe)."""
+    _, select, _ = TIERS[tier]
+    conn = open_db()
+    try:
+        if tier in ("minute", "hourly"):
+            source = union_source(partitions_for_range(conn, start, end))
+        else:
+            source = "hourly_history"
+        device_sql, device_args = _device_filter(devices)
+        sql = select.format(source=source, device_filter=device_sql)
+        return conn.execute(sql, (_fmt(start), _fmt(end), *device_args)).fetchall()
+    finally:
+        conn.close()
+
+def run_repair(conn: sqlite3.Connection, tier: str, since: datetime = None, until: datetime = None,
+               devices=None, chunk_hours: int = 24, workers: int = 1, resume: bool = True,
+               progress=print) -> int:
+    """
+    Rebuilds one tier over [since, until) in chunks; returns rows written.
+
+    Logic:
+    1. Range: Defaults to the whole source table, capped at the current
+       (unfinished) hour or day.
+    2. Resume: The job is keyed by the arguments given (job_key), so a
+       default run resumes too. It restarts from the recorded range start
+       and skips chunks before 'done_until'.
+    3. Reads: At most 2 x 'workers' chunks are in flight; results are
+       written in order.
+    4. Writes: Each chunk's rows and the progress marker commit together.
+    """
+    table, _, bucket_hours = TIERS[tier]
+    devices = sorted(devices) if devices else []
+    ensure_progress_table(conn)
+
+    job = job_key(tier, since, until, devices)
+    done = conn.execute(
+        "SELECT done_until, chunks_done, range_since FROM repair_progress WHERE job=?", (job,)
+    ).fetchone() if resume else None
+
+    first, _ = _source_bounds(conn, tier)
+    if first is None:
+        progress(f"[{tier}] nothing to repair")
+        return 0
+    cap = _floor(datetime.now(), bucket_hours)
+    since = since or (datetime.fromisoformat(done[2]) if done and done[2] else first)
+    until = min(until or cap, cap)
+
+    chunks = plan_chunks(since, until, chunk_hours, bucket_hours)
+    if done:
+        chunks = [c for c in chunks if _fmt(c[1]) > done[0]]
+        progress(f"[{tier}] resuming after {done[0]}")
+    chunks_done = done[1] if done else 0
+    total = chunks_done + len(chunks)
+
+    written = 0
+    marks = ",".join("?" * 18)
+    window = 2 * max(1, workers)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        queued = iter(chunks)
+
+        def submit():
+            chunk = next(queued, None)
+            if chunk is not None:
+                pending.append((chunk, pool.submit(read_chunk, tier, chunk[0], chunk[1], devices)))
+
+        for _ in range(window):
+            submit()
+        while pending:
+            (start, end), future = pending.popleft()
+            rows = future.result()
+            conn.executemany(UPSERT.format(table=table, marks=marks), rows)
+            chunks_done += 1
+            conn.execute("""
+                INSERT OR REPLACE INTO repair_progress
+                (job, done_until, chunks_done, updated_at, range_since, range_until)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (job, _fmt(end), chunks_done, _fmt(datetime.now()), _fmt(since), _fmt(until)))
+            conn.commit()
+            written += len(rows)
+            progress(f"[{tier}] {chunks_done}/{total} chunks ({chunks_done * 100 // max(total, 1)}%) "
+                     f"{_fmt(start)} -> {_fmt(end)}: {len(rows)} rows")
+            # One new read per chunk written keeps the window full
+            submit()
+
+    conn.execute("DELETE FROM repair_progress WHERE job=?", (job,))
+    conn.commit()
+    return written
+
+def repair_minute(conn: sqlite3.Connection, **options) -> int:
+    run_repair(conn, "minute", **options)
+    cur = conn.execute("SELECT COUNT(*) FROM minute_history")
+    return cur.fetchone()[0]
+
+def repair_hourly(conn: sqlite3.Connection, **options) -> int:
+    run_repair(conn, "hourly", **options)
+    cur = conn.execute("""
         SELECT COUNT(*)
         FROM hourly_history
         WHERE time_label < datetime('now','start of hour')
     """)
     return cur.fetchone()[0]
 
-def repair_daily(conn: sqlite3.Connection) -> int:
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT OR REPLACE INTO daily_history (
-          time_label,
-          device_id,
-          temp_min, temp_max, temp_avg,
-          hum_min, hum_max, hum_avg,
-          lux_min, lux_max, lux_avg,
-          gas_min, gas_max, gas_avg,
-          press_min, press_max, press_avg,
-          sample_count
-        )
-        SELECT
-          strftime('%Y-%m-%d', time_label) AS dy,
-          device_id,
-          MIN(temp_min), MAX(temp_max), AVG(temp_avg),
-          MIN(hum_min), MAX(hum_max), AVG(hum_avg),
-          MIN(lux_min), MAX(lux_max), AVG(lux_avg),
-          MIN(gas_min), MAX(gas_max), AVG(gas_avg),
-          MIN(press_min), MAX(press_max), AVG(press_avg),
-          SUM(sample_count)
-        FROM hourly_history
-        WHERE time_label < datetime('now','start of day')
-        GROUP BY dy, device_id
-        HAVING SUM(sample_count) > 0
-    """)
-    conn.commit()
-
-    cur.execute("""
+def repair_daily(conn: sqlite3.Connection, **options) -> int:
+    run_repair(conn, "daily", **options)
+    cur = conn.execute("""
         SELECT COUNT(*)
         FROM daily_history
         WHERE time_label < date('now')
@@ -120,19 +269,9 @@ def repair_daily(conn: sqlite3.Connection) -> int:
     return cur.fetchone()[0]
 
 def prune_raw(conn: sqlite3.Connection, retention_hours: int) -> int:
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM live_data")
-    before = cur.fetchone()[0]
-
-    cur.execute(
-        "DELETE FROM live_data WHERE date_time < datetime('now', ?)",
-        (f"-{retention_hours} hours",)
-    )
-    conn.commit()
-
-    cur.execute("SELECT COUNT(*) FROM live_data")
-    after = cur.fetchone()[0]
-    return before - after
+    before = len(list_partitions(conn))
+    drop_partitions_before(conn, hours_back(datetime.now(), retention_hours))
+    return before - len(list_partitions(conn))
 
 def vacuum(conn: sqlite3.Connection):
     iso = conn.isolation_level
@@ -142,14 +281,46 @@ def vacuum(conn: sqlite3.Connection):
     finally:
         conn.isolation_level = iso
 
-def main():
+def parse_time(value: str) -> datetime:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid time: {value!r}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild GreenSat history tiers in resumable chunks.")
+    parser.add_argument("--since", type=parse_time, help="start of the range (inclusive), e.g. 2026-03-01")
+    parser.add_argument("--until", type=parse_time, help="end of the range (exclusive)")
+    parser.add_argument("--device", type=int, action="append", help="device id to repair (repeatable)")
+    parser.add_argument("--tier", choices=["minute", "hourly", "daily", "all"], default="all")
+    parser.add_argument("--chunk-hours", type=int, default=24, help="hours per write transaction")
+    parser.add_argument("--workers", type=int, default=1, help="parallel read connections")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress")
+    parser.add_argument("--no-prune", action="store_true", help="skip raw retention")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip the final VACUUM")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = dict(since=args.since, until=args.until, devices=args.device,
+                   chunk_hours=args.chunk_hours, workers=args.workers, resume=not args.restart)
+    # A targeted repair must not touch data outside its range
+    targeted = bool(args.since or args.until or args.device)
+
     conn = open_db()
     try:
         ensure_schema(conn)
-        repair_hourly(conn)
-        repair_daily(conn)
-        prune_raw(conn, RAW_RETENTION_HOURS)
-        if RUN_VACUUM:
+        if args.tier in ("minute", "all"):
+            repair_minute(conn, **options)
+        if args.tier in ("hourly", "all"):
+            repair_hourly(conn, **options)
+        if args.tier in ("daily", "all"):
+            repair_daily(conn, **options)
+        if not args.no_prune and not targeted:
+            prune_raw(conn, RAW_RETENTION_HOURS)
+        if RUN_VACUUM and not args.no_vacuum and not targeted:
             vacuum(conn)
     finally:
         conn.close()
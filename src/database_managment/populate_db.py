@@ -7,6 +7,7 @@ import random
 import math
 from datetime import datetime, timedelta
 from shared.config import DB_PATH
+from shared.raw_store import ensure_raw_schema, insert_raw, drop_partitions_before
 
 def get_sim_val(current_date, device_id=0):
     """
@@ -49,22 +50,17 @@ def populate_tiered_db(years=1, num_devices=1):
     )
 
     # Clean start
+    cursor.execute("DROP VIEW IF EXISTS live_data")
     cursor.execute("DROP TABLE IF EXISTS live_data")
+    drop_partitions_before(conn, datetime.max)
+    cursor.execute("DROP TABLE IF EXISTS minute_history")
     cursor.execute("DROP TABLE IF EXISTS hourly_history")
     cursor.execute("DROP TABLE IF EXISTS daily_history")
     
+    cursor.execute(f"CREATE TABLE minute_history (time_label TEXT NOT NULL, {cols_def}, PRIMARY KEY(time_label, device_id))")
     cursor.execute(f"CREATE TABLE hourly_history (time_label TEXT NOT NULL, {cols_def}, PRIMARY KEY(time_label, device_id))")
     cursor.execute(f"CREATE TABLE daily_history (time_label TEXT NOT NULL, {cols_def}, PRIMARY KEY(time_label, device_id))")
-    cursor.execute('''CREATE TABLE live_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date_time TEXT,
-        temp REAL,
-        hum REAL,
-        lux REAL,
-        gas_pct REAL,
-        press REAL,
-        device_id INTEGER
-    )''')
+    ensure_raw_schema(conn)
 
     now = datetime.now()
 
@@ -108,7 +104,17 @@ def populate_tiered_db(years=1, num_devices=1):
             raw_data.append((date.strftime("%Y-%m-%d %H:%M:%S"), t, h, l, g, p, dev_id))
         
         # Now this will actually have data to insert
-        cursor.executemany("INSERT INTO live_data (date_time, temp, hum, lux, gas_pct, press, device_id) VALUES (?,?,?,?,?,?,?)", raw_data)
+        insert_raw(conn, raw_data)
+
+        # 4. Minute History: one raw sample per simulated minute
+        minute_data = []
+        for dt, t, h, l, g, p, d in raw_data:
+            row = [dt[:16] + ":00"]
+            for v in (t, h, l, g, p):
+                row.extend([v, v, v])
+            row.extend([1, d])
+            minute_data.append(tuple(row))
+        cursor.executemany(f"INSERT OR REPLACE INTO minute_history VALUES ({','.join(['?']*18)})", minute_data)
 
     conn.commit()
     conn.close()
@@ -1,5 +1,6 @@
 import serial
 import serial.tools.list_ports
+import argparse
 import json
 import time
 import os
@@ -8,6 +9,9 @@ import os
 USE_SIM = False
 COM_PORT = None
 BAUDRATE = 115200
+RECONNECT_DELAY = 5
+MAX_LINE_BYTES = 4096       # A line longer than this is noise; it is dropped, not buffered
+BRIDGE_BOOT = int.from_bytes(os.urandom(4), "big")  # Boot id for packets the probe did not number
 
 if USE_SIM:
     try:
@@ -17,15 +21,188 @@ if USE_SIM:
 else:
     Serial = serial.Serial
 
+class BridgeStats:
+    """Counters shared by the reader loop, the simulator and the benchmark."""
+    def __init__(self):
+        self.lines = 0
+        self.packets = 0
+        self.non_json = 0
+        self.bad_json = 0
+        self.sensor_errors = 0
+        self.overflows = 0
+        self.disconnects = 0
+        self.parse_seconds = 0.0
+        self.disconnected_at = None
+        self.recovery_times = []
+
+    def to_dict(self) -> dict:
+        return {
+            "lines": self.lines,
+            "packets": self.packets,
+            "non_json": self.non_json,
+            "bad_json": self.bad_json,
+            "sensor_errors": self.sensor_errors,
+            "overflows": self.overflows,
+            "disconnects": self.disconnects,
+            "parse_us_per_line": round(self.parse_seconds / self.lines * 1e6, 2) if self.lines else None,
+            "recovery_s": [round(t, 3) for t in self.recovery_times],
+        }
+
+class LineReader:
+    """
+    Reassembles lines from whatever bytes the port has.
+
+    readline() with a timeout returns half a line when the probe is slow,
+    which used to be dropped along with the rest of the line; here partial
+    data stays buffered until its newline arrives.
+    """
+    def __init__(self, ser, stats: BridgeStats = None):
+        self.ser = ser
+        self.buf = b""
+        self.stats = stats
+
+    def read_lines(self) -> list:
+        chunk = self.ser.read(max(1, self.ser.in_waiting))
+        if not chunk:
+            return []
+        self.buf += chunk
+        *lines, self.buf = self.buf.split(b"\n")
+        if len(self.buf) > MAX_LINE_BYTES:
+            self.buf = b""
+            if self.stats:
+                self.stats.overflows += 1
+        return lines
+
+def parse_line(raw: bytes, stats: BridgeStats = None):
+    """
+    Turns one serial line into a telemetry packet, or None.
+    Lines that are not a JSON object, do not decode, or report a sensor
+    error are skipped (and counted when 'stats' is given).
+    """
+    line = raw.decode("utf-8", errors="ignore").strip()
+    if not (line.startswith("{") and line.endswith("}")):
+        if stats and line:
+            stats.non_json += 1
+        return None
+
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        if stats:
+            stats.bad_json += 1
+        return None
+    if not isinstance(data, dict):
+        if stats:
+            stats.bad_json += 1
+        return None
+
+    if "error" in data:
+        if stats:
+            stats.sensor_errors += 1
+        print(f"Sensor Error: {data['error']}")
+        return None
+
+    return {
+        "device_id": data.get("device_id", data.get("id", 0)),
+        "temp_c":    data.get("temp_c", data.get("temp", 0)),
+        "humidity":  data.get("humidity", data.get("hum", 0)),
+        "lux":       data.get("lux", 0),
+        "pressure":  data.get("pressure_hpa", data.get("pressure", data.get("press", 0))),
+        "gas_pct":   data.get("gas_pct", data.get("gas", 0)),
+        "lat":       data.get("lat"),
+        "lon":       data.get("lon"),
+        "alt":       data.get("alt"),
+        "gps_fix":   data.get("gps_fix", 0),
+        "sats":      data.get("sats", 0),
+        "seq":       data.get("seq"),
+        "boot":      data.get("boot"),
+        # Reading time on this host's clock (a probe may report how old the reading is)
+        "timestamp": time.time() - float(data.get("age_ms", 0)) / 1000
+    }
+
+_bridge_seq = {}
+
+def stamp_sequence(packet: dict) -> dict:
+    """
+    Probes that number their packets keep their own seq/boot; others get a
+    per-device counter under this bridge's boot id, so retries of the same
+    packet are recognised by the server either way.
+    """
+    if packet.get("seq") is None:
+        device_id = packet["device_id"]
+        packet["seq"] = _bridge_seq.get(device_id, 0)
+        packet["boot"] = BRIDGE_BOOT
+        _bridge_seq[device_id] = packet["seq"] + 1
+    return packet
+
+def print_packet(packet: dict):
+    print(f"Packet Prepared: {packet}")
+
+def read_port(ser, on_packet, stats: BridgeStats, stop=None):
+    """Reads packets from an open port until it fails or 'stop' is set."""
+    reader = LineReader(ser, stats)
+    while not (stop and stop.is_set()):
+        # A blocking read (up to the port timeout) instead of polling
+        # in_waiting: it also surfaces a hang-up as a SerialException
+        for raw in reader.read_lines():
+            start = time.perf_counter()
+            packet = parse_line(raw, stats)
+            stats.parse_seconds += time.perf_counter() - start
+            stats.lines += 1
+            if packet is None:
+                continue
+            stats.packets += 1
+            if stats.disconnected_at is not None:
+                stats.recovery_times.append(time.monotonic() - stats.disconnected_at)
+                stats.disconnected_at = None
+            on_packet(stamp_sequence(packet))
+
+def run_bridge(port, on_packet=print_packet, stats: BridgeStats = None, stop=None,
+               reconnect_delay=RECONNECT_DELAY, rediscover=None):
+    """
+    Connect / read / reconnect loop for one port.
+
+    Logic:
+    1. Read: read_port() until the port fails.
+    2. Recover: Serial and OS errors close the port, wait 'reconnect_delay'
+       and reopen it; 'rediscover' (interactive port choice) may return a
+       different port first. Recovery time is measured from the failure to
+       the next good packet, so it includes the time the device was away.
+    """
+    stats = stats or BridgeStats()
+    while not (stop and stop.is_set()):
+        ser = None
+        try:
+            print(f"Connecting to {port}...")
+            ser = Serial(port, BAUDRATE, timeout=1)
+            print("Bridge Active. Reading Data...")
+            read_port(ser, on_packet, stats, stop)
+        except (serial.SerialException, OSError, AttributeError) as e:
+            print(f"Disconnected or Port Error: {e}")
+            stats.disconnects += 1
+            if stats.disconnected_at is None:
+                stats.disconnected_at = time.monotonic()
+            time.sleep(reconnect_delay)
+            if rediscover:
+                print("Attempting to rediscover ports...")
+                port = rediscover() or port
+        finally:
+            if ser is not None:
+                try:
+                    ser.close()
+                except (serial.SerialException, OSError):
+                    pass
+    return stats
+
 def choose_port():
     global COM_PORT
-    if USE_SIM: 
+    if USE_SIM:
         COM_PORT = "SIM_PORT"
-        return True
-    
+        return COM_PORT
+
     while True:
         ports = serial.tools.list_ports.comports()
-        
+
         if not ports:
             print("No COM ports found! Retrying in 5 seconds...")
             time.sleep(5)
@@ -34,12 +211,12 @@ def choose_port():
         if len(ports) == 1:
             COM_PORT = ports[0].device
             print(f"Automatically selected {COM_PORT}")
-            return True
+            return COM_PORT
         else:
             print("\nAvailable Ports:")
             for i, p in enumerate(ports):
                 print(f"{i+1}: {p.device}")
-            
+
             try:
                 choice = input(f"Select port [1-{len(ports)}] (or press Enter to refresh): ")
                 if not choice.strip():
@@ -47,56 +224,19 @@ def choose_port():
                 idx = int(choice) - 1
                 if 0 <= idx < len(ports):
                     COM_PORT = ports[idx].device
-                    return True
+                    return COM_PORT
             except ValueError:
                 print("Invalid input. Refreshing...")
                 time.sleep(1)
 
 if __name__ == "__main__":
-    choose_port()
-
-    while True:
-        try:
-            print(f"Connecting to {COM_PORT}...")
-            ser = Serial(COM_PORT, BAUDRATE, timeout=1)
-            print("Bridge Active. Reading Data...")
-
-            while True:
-                if ser.in_waiting <= 0:
-                    time.sleep(0.1)
-                    continue
+    parser = argparse.ArgumentParser(description="Serial to telemetry bridge")
+    parser.add_argument("--port", help="Serial port (e.g. a simulator pty); skips port discovery")
+    args = parser.parse_args()
 
-                line = ser.readline().decode("utf-8", errors="ignore").strip()
-                
-                if not (line.startswith("{") and line.endswith("}")):
-                    continue
-
-                try:
-                    data = json.loads(line)
-                    if "error" in data:
-                        print(f"Sensor Error: {data['error']}")
-                        continue
-
-                    telemetry_packet = {
-                        "device_id": data.get("device_id", data.get("id", 0)),
-                        "temp_c":    data.get("temp_c", data.get("temp", 0)),
-                        "humidity":  data.get("humidity", data.get("hum", 0)),
-                        "lux":       data.get("lux", 0),
-                        "pressure":  data.get("pressure_hpa", data.get("press", 0)),
-                        "gas_pct":   data.get("gas_pct", data.get("gas", 0)),
-                        "timestamp": time.time()
-                    }
-                    
-                    print(f"Packet Prepared: {telemetry_packet}")
-
-                except json.JSONDecodeError:
-                    continue
-
-        except (serial.SerialException, OSError, AttributeError) as e:
-            print(f"Disconnected or Port Error: {e}")
-            print("Attempting to rediscover ports...")
-            time.sleep(5)
-            choose_port() 
-        except KeyboardInterrupt:
-            print("\nBridge Stopped.")
-            break
\ No newline at end of file
+    port = args.port or choose_port()
+    try:
+        # A fixed --port is simply reopened; discovered ports are chosen again
+        run_bridge(port, rediscover=None if args.port else choose_port)
+    except KeyboardInterrupt:
+        print("\nBridge Stopped.")
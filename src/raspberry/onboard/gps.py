@@ -1,60 +1,215 @@
-from machine import UART, Pin
 import time
 
-# UART GPS Initialization
-# Using UART 1, common for Raspberry Pi Pico or ESP32
-gps = UART(1, baudrate=9600, tx=Pin(4), rx=Pin(5))
+# --- Incremental NMEA 0183 parser ---
+#
+# Bytes are fed as they arrive (UART, file, pty); complete sentences are
+# checksum-validated and folded into one fix state. Nothing here blocks or
+# imports 'machine', so the parser also runs on CPython against recorded
+# streams:  python gps.py recording.nmea
+
+MAX_SENTENCE = 96           # NMEA caps sentences at 82 chars; longer means line noise
+FIX_TIMEOUT_MS = 5000       # Fix is reported stale without a valid GGA/RMC for this long
+
+def _ticks_ms():
+    # MicroPython has ticks_ms(); CPython falls back to monotonic time
+    ticks = getattr(time, "ticks_ms", None)
+    return ticks() if ticks else int(time.monotonic() * 1000)
+
+def _ticks_diff(a, b):
+    diff = getattr(time, "ticks_diff", None)
+    return diff(a, b) if diff else a - b
 
 def convert(coord, direction):
     """
-    Converts NMEA coordinate format (DDMM.MMMM) to Decimal Degrees.
+    Converts NMEA coordinate format (DDMM.MMMM / DDDMM.MMMM) to Decimal Degrees.
     """
-    if coord == "":
+    if not coord or not direction:
         return None
-    deg = float(coord[:2])
-    minutes = float(coord[2:])
-    dec = deg + minutes / 60
-    if direction in ["S", "W"]:
+    dot = coord.find(".")
+    head = dot - 2 if dot >= 0 else len(coord) - 2
+    dec = float(coord[:head]) + float(coord[head:]) / 60
+    if direction in ("S", "W"):
         dec = -dec
-    return dec
+    return round(dec, 7)
+
+def checksum(body):
+    """XOR of every byte between '$' and '*'."""
+    value = 0
+    for b in body:
+        value ^= b
+    return value
 
-def parse_gps(line):
+def _float(field):
+    return float(field) if field else None
+
+def _int(field):
+    return int(field) if field else None
+
+class NMEAParser:
     """
-    Parses a GPGGA sentence to extract Latitude, Longitude, and Altitude.
+    Byte-stream NMEA parser for GGA, RMC and GSA sentences (any talker: GP, GN, GL...).
+
+    Logic:
+    1. Framing: feed() appends bytes and handles every complete line; a
+       partial line stays buffered until the rest arrives.
+    2. Validation: Sentences without a correct '*hh' checksum, or longer
+       than MAX_SENTENCE, are counted and dropped.
+    3. State: GGA gives position, altitude, fix quality and satellites; RMC
+       gives validity, speed, course and date; GSA gives the 2D/3D fix mode
+       and dilutions. fix() returns a snapshot of the merged state.
     """
-    parts = line.split(",")
-
-    # $GPGGA is the standard NMEA sentence for fix data
-    # parts[6] is the fix quality (0 = no fix)
-    if parts[0] == "$GPGGA" and parts[6] != "0":
-        lat = convert(parts[2], parts[3])
-        lon = convert(parts[4], parts[5])
-        alt = parts[9]
-
-        return lat, lon, alt
-    return None
-
-print("GPS searching for satellites...")
-
-while True:
-    if gps.any():
-        line = gps.readline()
-        # Print raw data for debugging
-        print(line)
-        
+    def __init__(self):
+        self.buf = b""
+        self.state = {
+            "lat": None, "lon": None, "alt": None,
+            "fix": 0, "sats": 0, "hdop": None,
+            "mode": 1, "pdop": None, "vdop": None,
+            "valid": False, "speed_kn": None, "course": None,
+            "utc": None, "date": None,
+        }
+        self.last_fix_ms = None
+        self.stats = {"sentences": 0, "bad_checksum": 0, "malformed": 0, "overflow": 0, "ignored": 0}
+
+    def feed(self, data):
+        """Consumes raw bytes; returns the number of valid sentences handled."""
+        if not data:
+            return 0
+        self.buf += data
+        handled = 0
+        while True:
+            end = self.buf.find(b"\n")
+            if end < 0:
+                break
+            line = self.buf[:end].strip()
+            self.buf = self.buf[end + 1:]
+            if line and self.parse_sentence(line):
+                handled += 1
+
+        if len(self.buf) > MAX_SENTENCE:
+            # No newline for too long: resync on the last sentence start
+            self.stats["overflow"] += 1
+            start = self.buf.rfind(b"$")
+            self.buf = self.buf[start:] if 0 <= start and len(self.buf) - start <= MAX_SENTENCE else b""
+        return handled
+
+    def parse_sentence(self, line):
+        """Validates and applies one sentence (bytes, no line ending)."""
+        start = line.rfind(b"$")
+        star = line.rfind(b"*")
+        if start < 0 or star < start or len(line) - start > MAX_SENTENCE:
+            self.stats["malformed"] += 1
+            return False
         try:
-            # Decode the byte string from UART
-            line = line.decode("utf-8")
-            data = parse_gps(line)
-
-            if data:
-                lat, lon, alt = data
-                print("Latitude :", lat)
-                print("Longitude:", lon)
-                print("Altitude :", alt, "m")
-                print("--------------------")
-        except:
-            # Handle potential decoding errors from noisy UART signals
-            pass
-
-    time.sleep(0.2)
\ No newline at end of file
+            expected = int(line[star + 1:star + 3], 16)
+            body = line[start + 1:star]
+            if checksum(body) != expected:
+                self.stats["bad_checksum"] += 1
+                return False
+            fields = body.decode().split(",")
+        except (ValueError, UnicodeError):
+            self.stats["malformed"] += 1
+            return False
+
+        kind = fields[0][2:] if len(fields[0]) == 5 else fields[0]
+        handler = {"GGA": self._gga, "RMC": self._rmc, "GSA": self._gsa}.get(kind)
+        if handler is None:
+            self.stats["ignored"] += 1
+            return False
+        try:
+            handler(fields)
+        except (ValueError, IndexError):
+            self.stats["malformed"] += 1
+            return False
+        self.stats["sentences"] += 1
+        return True
+
+    def _gga(self, f):
+        # $xxGGA,time,lat,N,lon,E,quality,sats,hdop,alt,M,geoid,M,age,station
+        quality = _int(f[6]) or 0
+        self.state["utc"] = f[1] or self.state["utc"]
+        self.state["fix"] = quality
+        self.state["sats"] = _int(f[7]) or 0
+        self.state["hdop"] = _float(f[8])
+        if quality > 0:
+            self.state["lat"] = convert(f[2], f[3])
+            self.state["lon"] = convert(f[4], f[5])
+            self.state["alt"] = _float(f[9])
+            self.last_fix_ms = _ticks_ms()
+
+    def _rmc(self, f):
+        # $xxRMC,time,status,lat,N,lon,E,speed,course,date,magvar,E[,mode]
+        valid = f[2] == "A"
+        self.state["utc"] = f[1] or self.state["utc"]
+        self.state["valid"] = valid
+        self.state["date"] = f[9] or self.state["date"]
+        if valid:
+            self.state["lat"] = convert(f[3], f[4])
+            self.state["lon"] = convert(f[5], f[6])
+            self.state["speed_kn"] = _float(f[7])
+            self.state["course"] = _float(f[8])
+            self.last_fix_ms = _ticks_ms()
+
+    def _gsa(self, f):
+        # $xxGSA,mode,fix type,sv1..sv12,pdop,hdop,vdop
+        self.state["mode"] = _int(f[2]) or 1
+        self.state["pdop"] = _float(f[15])
+        self.state["vdop"] = _float(f[17]) if len(f) > 17 else None
+
+    def has_fix(self):
+        if self.last_fix_ms is None or self.state["fix"] == 0:
+            return False
+        return _ticks_diff(_ticks_ms(), self.last_fix_ms) < FIX_TIMEOUT_MS
+
+    def fix(self):
+        """Snapshot of the merged state; position fields are None without a current fix."""
+        snap = dict(self.state)
+        if not self.has_fix():
+            snap["lat"] = snap["lon"] = snap["alt"] = None
+            snap["fix"] = 0
+        return snap
+
+class GPS:
+    """
+    Non-blocking UART reader: poll() drains whatever bytes are waiting and
+    returns immediately, so it can be called from the sensor loop.
+    """
+    def __init__(self, uart):
+        self.uart = uart
+        self.parser = NMEAParser()
+
+    def poll(self):
+        waiting = self.uart.any()
+        if waiting:
+            self.parser.feed(self.uart.read(waiting))
+        return self.parser.has_fix()
+
+    def telemetry(self):
+        """Fields added to the telemetry packet."""
+        snap = self.parser.fix()
+        return {"lat": snap["lat"], "lon": snap["lon"], "alt": snap["alt"],
+                "gps_fix": snap["fix"], "sats": snap["sats"]}
+
+def open_gps(uart_id, tx_pin, rx_pin, baudrate=9600):
+    """Creates the GPS on a hardware UART (MicroPython only)."""
+    from machine import UART, Pin  # type: ignore
+    # A larger RX buffer covers a full NMEA burst between two polls
+    return GPS(UART(uart_id, baudrate=baudrate, tx=Pin(tx_pin), rx=Pin(rx_pin), rxbuf=1024))
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        # Replay a recorded stream on the desktop, in small chunks like a UART
+        parser = NMEAParser()
+        with open(sys.argv[1], "rb") as f:
+            for chunk in iter(lambda: f.read(32), b""):
+                if parser.feed(chunk):
+                    print(parser.fix())
+        print(parser.stats)
+    else:
+        gps = open_gps(1, 4, 5)
+        print("GPS searching for satellites...")
+        while True:
+            if gps.poll():
+                print(gps.telemetry())
+            time.sleep(0.2)
@@ -1,9 +1,11 @@
 import time
 import json
+import os
 import network
 import requests
 from machine import Pin, I2C
 from sensors import GasSensor, TempHumSensor, LightSensor, PressureSensor, Alarm
+from gps import open_gps
 
 # --- Configuration ---
 DEVICE_ID = 1
@@ -22,8 +24,22 @@ PIN_SCL_BMP   = 3
 PIN_SDA_LUX   = 0
 PIN_SCL_LUX   = 1
 PIN_BUZZER_POWER = 8
+# GPS on UART0 (GP4, used by gps.py's standalone wiring, is the BMP power rail here)
+GPS_UART = 0
+PIN_GPS_TX = 12
+PIN_GPS_RX = 13
+LOOP_PERIOD_MS = 1000
+GPS_POLL_MS = 50
+# Unsent packets are kept and resent (the server drops duplicates by seq)
+OUTBOX_MAX = 120
+BATCH_MAX = 20
 wlan = None
 
+# Random per boot: the server resets its sequence tracking when it changes
+BOOT_ID = int.from_bytes(os.urandom(4), "big")
+seq = 0
+outbox = []
+
 def connect_wifi():
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
@@ -62,12 +78,14 @@ gas_sensor = GasSensor(PIN_GAS_ADC)
 dht_sensor = TempHumSensor(PIN_DHT_DATA)
 lux_sensor = LightSensor(i2c_lux)
 bmp_sensor = PressureSensor(i2c_pres)
+gps = open_gps(GPS_UART, PIN_GPS_TX, PIN_GPS_RX)
 
 gas_sensor.calibrate()
 connect_wifi()
 print("System Initialized.")
 
 while True:
+    loop_start = time.ticks_ms()
     try:
         # 1. Data Acquisition
         raw_gas, gas_pct = gas_sensor.read()
@@ -85,12 +103,29 @@ while True:
             "gas_pct": round(gas_pct, 2),
             "timestamp": time.time()
         }
+        gps.poll()
+        telemetry_packet.update(gps.telemetry())
+        telemetry_packet["seq"] = seq
+        telemetry_packet["boot"] = BOOT_ID
+        seq += 1
+        # Kept with its reading tick; 'age_ms' is filled in at send time
+        outbox.append((loop_start, telemetry_packet))
+        if len(outbox) > OUTBOX_MAX:
+            # Oldest readings give way; the server records them as a gap
+            outbox.pop(0)
 
-        # 3. Transmission
+        # 3. Transmission (oldest first; a batch leaves the outbox only on a 200)
         try:
             headers = {'Content-Type': 'application/json'}
-            response = requests.post(API_URL, data=json.dumps(telemetry_packet), headers=headers, timeout=5)
-            print(f"Sent (Status: {response.status_code})")
+            sent_at = time.ticks_ms()
+            batch = []
+            for read_at, packet in outbox[:BATCH_MAX]:
+                packet["age_ms"] = time.ticks_diff(sent_at, read_at)
+                batch.append(packet)
+            response = requests.post(API_URL, data=json.dumps(batch), headers=headers, timeout=5)
+            print(f"Sent {len(batch)} (Status: {response.status_code}, queued: {len(outbox) - len(batch)})")
+            if response.status_code == 200:
+                del outbox[:len(batch)]
             response.close() 
         except Exception as e:
             print(f"WiFi Send Error: {e}")
@@ -104,4 +139,7 @@ while True:
     except Exception as e:
         print(f"System Error: {e}")
 
-    time.sleep(1)
\ No newline at end of file
+    # Wait out the rest of the period while draining the GPS UART
+    while time.ticks_diff(time.ticks_ms(), loop_start) < LOOP_PERIOD_MS:
+        gps.poll()
+        time.sleep_ms(GPS_POLL_MS)
\ No newline at end of file
@@ -1,26 +1,359 @@
+import argparse
+import errno
 import json
+import os
 import random
+import sys
+import threading
 import time
+import tty
 
 class FakeSerial:
-    def __init__(self, port=None, baudrate=None, timeout=None):
+    """In-process stand-in for one probe (bridge.py with USE_SIM = True)."""
+    def __init__(self, port=None, baudrate=None, timeout=None, device_id=1, period=2.0):
         self.port = port
-        self.in_waiting = 1
+        self.timeout = timeout
+        self.device_id = device_id
+        self.period = period
         self.start_time = time.time()
+        self.next_line = self.start_time
+        self.buf = b""
+
+    @property
+    def in_waiting(self):
+        if time.time() >= self.next_line:
+            self.buf += make_line(self.device_id)
+            self.next_line += self.period
+        return len(self.buf)
+
+    def read(self, size=1):
+        # Blocks up to 'timeout' like a real port, so readers do not spin
+        deadline = time.time() + (self.timeout or 0)
+        while not self.in_waiting and time.time() < deadline:
+            time.sleep(0.05)
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
 
     def readline(self):
-        time.sleep(2) 
-        
-        data = {
-            "pressure": round(random.uniform(980, 1010), 1),
-            "time": time.time(),
-            "device_id": 1,
-            "gas_pct": round(random.uniform(1.0, 5.0), 2),
-            "temp_c": random.randint(20, 25),
-            "humidity": random.randint(30, 50),
-            "lux": round(random.uniform(200, 500), 1)
-        }
-        return (json.dumps(data) + "\n").encode("utf-8")
+        while b"\n" not in self.buf:
+            if not self.in_waiting:
+                time.sleep(0.05)
+        line, self.buf = self.buf.split(b"\n", 1)
+        return line + b"\n"
+
+    def close(self):
+        pass
+
+def make_line(device_id: int, rng=random) -> bytes:
+    data = {
+        "pressure": round(rng.uniform(980, 1010), 1),
+        "time": time.time(),
+        "device_id": device_id,
+        "gas_pct": round(rng.uniform(1.0, 5.0), 2),
+        "temp_c": rng.randint(20, 25),
+        "humidity": rng.randint(30, 50),
+        "lux": round(rng.uniform(200, 500), 1)
+    }
+    return (json.dumps(data) + "\n").encode("utf-8")
+
+# --- Pseudo-terminal probe fleet ---
+#
+# Every virtual probe owns a pty pair. The simulator writes to the master
+# side; the slave side is a real tty that bridge.py opens with pyserial, so
+# the bridge's framing, parsing and reconnect code paths run unchanged.
+# Each probe is reachable through a stable symlink (<dir>/probe<N>) that is
+# re-pointed when a disconnect recreates its pty.
+
+class FaultProfile:
+    """
+    Per-line fault probabilities and fleet events.
+
+    corrupt: a byte is flipped, dropped or the line truncated
+    noise: a non-JSON line (boot banner, debug print) is sent
+    sensor_error: an {"error": ...} line is sent
+    partial: the line is written in 2-3 pieces with short pauses
+    burst_every / burst_size: seconds between bursts and lines per burst
+    disconnect_every / down_time: mean seconds between disconnects and outage length
+    """
+    def __init__(self, corrupt=0.0, noise=0.0, sensor_error=0.0, partial=0.0,
+                 burst_every=0.0, burst_size=50, disconnect_every=0.0, down_time=1.0):
+        self.corrupt = corrupt
+        self.noise = noise
+        self.sensor_error = sensor_error
+        self.partial = partial
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.disconnect_every = disconnect_every
+        self.down_time = down_time
+
+class PtyProbe:
+    def __init__(self, device_id: int, link_dir: str, rate: float, faults: FaultProfile, rng: random.Random):
+        self.device_id = device_id
+        self.link = os.path.join(link_dir, f"probe{device_id}")
+        self.period = 1.0 / rate if rate > 0 else None
+        self.faults = faults
+        self.rng = rng
+        self.master = None
+        self.slave = None
+        self.pending = b""
+        self.pieces = []
+        self.next_line = time.monotonic()
+        self.next_burst = self._schedule(faults.burst_every)
+        self.next_disconnect = self._schedule(faults.disconnect_every)
+        self.up_at = None
+        self.stats = {"sent": 0, "valid": 0, "corrupt": 0, "noise": 0, "sensor_error": 0,
+                      "partial": 0, "bursts": 0, "disconnects": 0, "dropped": 0, "backpressure": 0}
+
+    def _schedule(self, mean):
+        return time.monotonic() + self.rng.expovariate(1.0 / mean) if mean else None
+
+    def open(self):
+        self.master, self.slave = os.openpty()
+        # Raw mode: no echo, no CR/LF translation, bytes pass through untouched
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        tmp = self.link + ".tmp"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        os.symlink(os.ttyname(self.slave), tmp)
+        os.replace(tmp, self.link)
 
     def close(self):
-        pass
\ No newline at end of file
+        # Lines still queued when the link drops never reach the reader
+        self.stats["dropped"] += self.pending.count(b"\n") + sum(piece.count(b"\n") for piece in self.pieces)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+        self.pending = b""
+        self.pieces = []
+
+    def _make(self) -> bytes:
+        f, rng = self.faults, self.rng
+        roll = rng.random()
+        if roll < f.noise:
+            self.stats["noise"] += 1
+            return b"GreenSat probe v1.0 ready\n"
+        roll -= f.noise
+        if roll < f.sensor_error:
+            self.stats["sensor_error"] += 1
+            return json.dumps({"device_id": self.device_id, "error": "DHT11 timeout"}).encode() + b"\n"
+        line = make_line(self.device_id, rng)
+        if rng.random() < f.corrupt:
+            self.stats["corrupt"] += 1
+            body = bytearray(line[:-1])
+            pos = rng.randrange(len(body))
+            action = rng.randrange(3)
+            if action == 0:
+                body[pos] ^= 1 << rng.randrange(8)
+            elif action == 1:
+                del body[pos]
+            else:
+                body = body[:pos]
+            return bytes(body) + b"\n"
+        self.stats["valid"] += 1
+        return line
+
+    def _queue(self, line: bytes):
+        self.stats["sent"] += 1
+        if self.rng.random() < self.faults.partial and len(line) > 4:
+            # Pieces are released one per tick, so the reader sees a pause mid-line
+            self.stats["partial"] += 1
+            cuts = sorted(self.rng.sample(range(1, len(line) - 1), self.rng.choice((1, 2))))
+            bounds = [0, *cuts, len(line)]
+            self.pieces.extend(line[a:b] for a, b in zip(bounds, bounds[1:]))
+        elif self.pieces:
+            self.pieces.append(line)
+        else:
+            self.pending += line
+
+    def tick(self, now: float):
+        """Advances the probe; returns False while it is disconnected."""
+        if self.master is None:
+            if now >= self.up_at:
+                # An unplugged probe produces nothing: the schedule restarts now
+                self.open()
+                self.next_line = now
+                self.next_disconnect = self._schedule(self.faults.disconnect_every)
+            return False
+
+        if self.next_disconnect and now >= self.next_disconnect:
+            self.stats["disconnects"] += 1
+            self.close()
+            self.up_at = now + self.faults.down_time
+            return False
+
+        if self.period:
+            while now >= self.next_line:
+                self._queue(self._make())
+                self.next_line += self.period
+        if self.next_burst and now >= self.next_burst:
+            self.stats["bursts"] += 1
+            for _ in range(self.faults.burst_size):
+                self._queue(self._make())
+            self.next_burst = self._schedule(self.faults.burst_every)
+
+        if self.pieces and not self.pending:
+            self.pending = self.pieces.pop(0)
+        if self.pending:
+            try:
+                written = os.write(self.master, self.pending)
+                self.pending = self.pending[written:]
+            except BlockingIOError:
+                # The pty buffer is full: the reader is not keeping up
+                self.stats["backpressure"] += 1
+            except OSError as e:
+                if e.errno != errno.EIO:
+                    raise
+        return True
+
+class FleetSimulator:
+    """
+    Drives many PtyProbes from one thread at configurable line rates.
+
+    Logic:
+    1. Clock: Every TICK seconds each probe emits the lines that fell due
+       since the last tick, so high rates arrive in small bursts like a
+       buffered USB serial link.
+    2. Faults: FaultProfile decides per line (corruption, noise, sensor
+       errors, split writes) and per probe (bursts, disconnects).
+    3. Totals: stats() sums the probe counters; 'valid' is the number of
+       packets a perfect bridge would forward. A flipped digit can still
+       parse, so a bridge may forward slightly more than 'valid' under
+       corruption: the serial format has no checksum.
+    """
+    TICK = 0.005
+
+    def __init__(self, probes=4, rate=10.0, faults=None, link_dir=None, seed=None):
+        self.link_dir = link_dir or os.path.join("/tmp", f"greensat-sim-{os.getpid()}")
+        os.makedirs(self.link_dir, exist_ok=True)
+        rng = random.Random(seed)
+        self.probes = [PtyProbe(i + 1, self.link_dir, rate, faults or FaultProfile(), random.Random(rng.random()))
+                       for i in range(probes)]
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def ports(self) -> list:
+        return [p.link for p in self.probes]
+
+    def start(self):
+        for probe in self.probes:
+            probe.open()
+            probe.next_line = time.monotonic()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            for probe in self.probes:
+                probe.tick(now)
+            time.sleep(self.TICK)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        for probe in self.probes:
+            probe.close()
+            if os.path.lexists(probe.link):
+                os.unlink(probe.link)
+        try:
+            os.rmdir(self.link_dir)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        totals = {}
+        for probe in self.probes:
+            for key, value in probe.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+def benchmark(sim: FleetSimulator, seconds: float, reconnect_delay: float = 0.2) -> dict:
+    """Runs one bridge reader per probe against the fleet and reports throughput."""
+    from bridge import BridgeStats, run_bridge
+
+    stop = threading.Event()
+    stats = [BridgeStats() for _ in sim.ports]
+    readers = [threading.Thread(target=run_bridge, args=(port,),
+                                kwargs={"on_packet": lambda packet: None, "stats": s, "stop": stop,
+                                        "reconnect_delay": reconnect_delay}, daemon=True)
+               for port, s in zip(sim.ports, stats)]
+
+    # Quiet the bridge's per-event prints so they do not dominate the measurement
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        for reader in readers:
+            reader.start()
+        started = time.monotonic()
+        time.sleep(seconds)
+        stop.set()
+        for reader in readers:
+            reader.join(timeout=2)
+        elapsed = time.monotonic() - started
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    lines = sum(s.lines for s in stats)
+    packets = sum(s.packets for s in stats)
+    parse = sum(s.parse_seconds for s in stats)
+    recovery = [t for s in stats for t in s.recovery_times]
+    sent = sim.stats()
+    return {
+        "seconds": round(elapsed, 2),
+        "lines_per_s": round(lines / elapsed, 1),
+        "packets_per_s": round(packets / elapsed, 1),
+        "parse_us_per_line": round(parse / lines * 1e6, 2) if lines else None,
+        "packets": packets,
+        "expected_packets": sent["valid"],
+        "rejected": {key: sum(getattr(s, key) for s in stats)
+                     for key in ("non_json", "bad_json", "sensor_errors", "overflows")},
+        # Every failed read or reopen attempt counts, so this exceeds the simulated disconnects
+        "port_errors": sum(s.disconnects for s in stats),
+        "recovery_s": {"count": len(recovery),
+                       "max": round(max(recovery), 3) if recovery else None,
+                       "mean": round(sum(recovery) / len(recovery), 3) if recovery else None},
+        "simulator": sent,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual probe fleet on pseudo-terminals (Linux/macOS)")
+    parser.add_argument("--probes", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=10.0, help="Lines per second per probe")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="Probability a line is corrupted")
+    parser.add_argument("--noise", type=float, default=0.0, help="Probability of a non-JSON line")
+    parser.add_argument("--sensor-error", type=float, default=0.0, help="Probability of an error line")
+    parser.add_argument("--partial", type=float, default=0.0, help="Probability a line is split across writes")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Mean seconds between bursts")
+    parser.add_argument("--burst-size", type=int, default=50)
+    parser.add_argument("--disconnect-every", type=float, default=0.0, help="Mean seconds between disconnects")
+    parser.add_argument("--down-time", type=float, default=1.0, help="Seconds a disconnected probe stays away")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--bench", type=float, metavar="SECONDS",
+                        help="Run bridge readers against the fleet and print the results")
+    args = parser.parse_args()
+
+    faults = FaultProfile(args.corrupt, args.noise, args.sensor_error, args.partial, args.burst_every,
+                          args.burst_size, args.disconnect_every, args.down_time)
+    sim = FleetSimulator(args.probes, args.rate, faults, seed=args.seed).start()
+    try:
+        if args.bench:
+            print(json.dumps(benchmark(sim, args.bench), indent=2))
+        else:
+            print("Virtual probes (python bridge.py --port <path>):")
+            for port in sim.ports:
+                print(f"  {port}")
+            while True:
+                time.sleep(5)
+                print(sim.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
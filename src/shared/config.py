@@ -1,4 +1,61 @@
 import os
+import sys
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'greensat.db')
\ No newline at end of file
+DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'greensat.db')
+
+# --- Web server ---
+# Worker processes under gunicorn (Windows/waitress always runs one). Each
+# worker holds its own hot window and detector baselines, so memory grows
+# with this; a Raspberry Pi is well served by 2-3.
+WEB_WORKERS = 1 if sys.platform == "win32" else int(os.environ.get("GREENSAT_WORKERS", 3))
+
+# --- SQLite WAL tuning ---
+WAL_AUTOCHECKPOINT_PAGES = 1000            # SQLite's own checkpoint trigger (per connection)
+JOURNAL_SIZE_LIMIT_BYTES = 64 * 1024 * 1024  # WAL file is truncated back to this after checkpoints
+WAL_RESTART_BYTES = 16 * 1024 * 1024       # Above this, try RESTART instead of PASSIVE
+WAL_TRUNCATE_BYTES = 128 * 1024 * 1024     # Above this, try TRUNCATE when no reader is active
+READ_CHUNK_ROWS = 5000                     # Rows fetched per short read transaction
+MAX_READ_TXN_SECONDS = 0.25                # Chunk size shrinks when a read takes longer
+
+# --- Cold archive ---
+ARCHIVE_DIR = os.path.join(PROJECT_ROOT, 'data', 'archive')
+ARCHIVE_ENABLED = True
+
+# --- Query result cache ---
+CACHE_MAX_ENTRIES = 512
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_OPEN_TTL_SECONDS = 5                 # Open ranges: bound staleness across worker processes
+
+# --- Ingest anomaly detection ---
+# kind: threshold (above/below), rate (max change per second), zscore (EWMA
+# deviation), stuck (identical readings in a row), spread (rolling max - min
+# over the last 300 samples), dropout (seconds silent)
+DETECTION_RULES = [
+    {"name": "gas_critical", "metric": "gas_pct", "kind": "threshold", "above": 30.0, "severity": "critical"},
+    {"name": "temp_high", "metric": "temp", "kind": "threshold", "above": 35.0, "severity": "warning"},
+    {"name": "temp_jump", "metric": "temp", "kind": "rate", "limit": 2.0, "severity": "warning"},
+    {"name": "press_jump", "metric": "press", "kind": "rate", "limit": 5.0, "severity": "warning"},
+    {"name": "gas_anomaly", "metric": "gas_pct", "kind": "zscore", "limit": 5.0, "severity": "info"},
+    {"name": "temp_stuck", "metric": "temp", "kind": "stuck", "limit": 3600, "severity": "warning"},
+    {"name": "probe_silent", "metric": None, "kind": "dropout", "limit": 60, "severity": "critical"},
+]
+DETECTION_EWMA_ALPHA = 0.05
+DETECTION_WARMUP_SAMPLES = 30
+DETECTION_HISTORY_SECONDS = 3600           # Stored rows replayed to rebuild baselines in a new process
+
+# --- Statistics API ---
+STATS_POINT_BUDGET = 200000                # Per device; picks the tier for /api/stats
+STATS_CACHE_MAX_BYTES = 32 * 1024 * 1024   # Closed monthly arrays kept in memory
+
+# --- In-memory hot window (recent raw samples per device) ---
+HOT_WINDOW_HOURS = 6
+HOT_WINDOW_MAX_BYTES = 32 * 1024 * 1024    # All device rings of all WEB_WORKERS together (split evenly)
+HOT_SYNC_SECONDS = 1.0                     # Pick up other workers' inserts at most this often
+HOT_RING_IDLE_SECONDS = 300                # A device ring unused this long can be evicted to make room
+
+# --- Idempotent ingest ---
+SEQ_MAX_GAP_RANGES = 256                   # Missing-seq ranges kept per device; older ones count as lost
+INGEST_MAX_BATCH = 500                     # Packets accepted per /upload/raw request
+INGEST_MAX_AGE_SECONDS = 900               # Oldest reading time accepted; also how far rollups look back
+INGEST_CLOCK_SKEW_SECONDS = 60             # Client 'timestamp' this far ahead of the server is still trusted
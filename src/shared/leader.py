@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import threading
+from shared.config import PROJECT_ROOT
+
+# --- Single-leader election (file lock) ---
+#
+# Several processes may serve the app, but only one may run db_manager.
+# The first process to lock LEADER_LOCK_PATH becomes the leader; the lock is
+# released by the OS when that process exits, so a follower takes over.
+
+LEADER_LOCK_PATH = os.path.join(PROJECT_ROOT, 'data', 'maintenance.lock')
+RETRY_SECONDS = 30
+
+_lock_file = None
+
+def try_acquire(path: str = LEADER_LOCK_PATH) -> bool:
+    """Non-blocking attempt to become leader. Keeps the handle open on success."""
+    global _lock_file
+    if _lock_file is not None:
+        return True
+
+    f = open(path, "a+")
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    _lock_file = f
+    return True
+
+def is_leader() -> bool:
+    return _lock_file is not None
+
+def leader_pid(path: str = LEADER_LOCK_PATH):
+    """PID recorded by the current leader, if any."""
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return int(value) if value else None
+    except (OSError, ValueError):
+        return None
+
+def run_as_leader(target, retry: int = RETRY_SECONDS):
+    """Blocks until this process is leader, then runs target()."""
+    while not try_acquire():
+        time.sleep(retry)
+    target()
+
+def start_leader_thread(target) -> threading.Thread:
+    """Runs target() in a daemon thread once this process wins the election."""
+    thread = threading.Thread(target=run_as_leader, args=(target,), daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,264 @@
+import sqlite3
+from datetime import datetime, date, timedelta
+
+# --- Time-partitioned raw storage ---
+#
+# Raw samples live in one table per calendar day (live_data_pYYYYMMDD).
+# 'live_data' is a read-only UNION ALL view over every partition so ad-hoc
+# queries keep working, while hot paths route to the partitions they need.
+# Retention then becomes a DROP TABLE instead of DELETE + VACUUM.
+
+RAW_VIEW = "live_data"
+PARTITION_PREFIX = "live_data_p"
+RAW_COLUMNS = "id, date_time, temp, hum, lux, gas_pct, press, device_id"
+RAW_SEQ_TABLE = "raw_seq"
+
+_known_partitions = set()
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+def partition_day(name: str) -> date:
+    return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+
+def _to_day(value) -> date:
+    """Accepts a date, a datetime or a 'YYYY-MM-DD[ HH:MM:SS]' label."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+def list_partitions(conn: sqlite3.Connection) -> list:
+    """Returns every raw partition table name, oldest first."""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ? ORDER BY name ASC",
+        (PARTITION_PREFIX + "%",)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def partitions_for_range(conn: sqlite3.Connection, start=None, end=None) -> list:
+    """
+    Routes a time range to the partitions that can hold matching rows.
+    Open bounds (None) select every partition on that side.
+    """
+    first = _to_day(start) if start else None
+    last = _to_day(end) if end else None
+    selected = []
+    for name in list_partitions(conn):
+        day = partition_day(name)
+        if first and day < first:
+            continue
+        if last and day > last:
+            continue
+        selected.append(name)
+    return selected
+
+def union_source(tables: list) -> str:
+    """Builds a FROM-able subquery over the given partitions."""
+    if not tables:
+        return f"(SELECT {RAW_COLUMNS} FROM (SELECT NULL AS id, NULL AS date_time, NULL AS temp, NULL AS hum, " \
+               f"NULL AS lux, NULL AS gas_pct, NULL AS press, NULL AS device_id) WHERE 0)"
+    return "(" + " UNION ALL ".join(f"SELECT {RAW_COLUMNS} FROM {t}" for t in tables) + ")"
+
+def rebuild_view(conn: sqlite3.Connection):
+    """Re-points the 'live_data' view at the current set of partitions."""
+    conn.execute(f"DROP VIEW IF EXISTS {RAW_VIEW}")
+    conn.execute(f"CREATE VIEW {RAW_VIEW} AS SELECT * FROM {union_source(list_partitions(conn))}")
+
+def create_partition_indexes(conn: sqlite3.Connection, name: str):
+    """
+    Per-partition indexes: (device_id, date_time) for device queries, and
+    date_time alone (which ends in the rowid, i.e. (date_time, id)) for
+    keyset reads over all devices, such as exports.
+    """
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_dev_dt ON {name}(device_id, date_time)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_dt ON {name}(date_time)")
+
+def ensure_partition(conn: sqlite3.Connection, day, refresh_view: bool = True) -> str:
+    """
+    Creates the partition for 'day' if it does not exist yet.
+
+    Logic:
+    1. Cache: Known partitions are remembered per process so the ingest path
+       does not hit sqlite_master on every insert.
+    2. Ids: Rows get their id from the shared 'raw_seq' counter (insert_raw),
+       never from the partition, so ids stay globally unique and increasing.
+    3. View: The 'live_data' view is rebuilt to include the new partition.
+    4. Transaction: Runs inside the caller's transaction and leaves the commit
+       to it; a caller that rolls back calls forget_partitions().
+    """
+    name = partition_name(_to_day(day))
+    if name in _known_partitions:
+        return name
+
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    if not exists:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date_time TEXT,
+                temp REAL,
+                hum REAL,
+                lux REAL,
+                gas_pct REAL,
+                press REAL,
+                device_id INTEGER NOT NULL
+            )
+        """)
+        create_partition_indexes(conn, name)
+
+        if refresh_view:
+            rebuild_view(conn)
+
+    _known_partitions.add(name)
+    return name
+
+def forget_partitions():
+    """Drops the partition cache after a rollback that may have undone a CREATE."""
+    _known_partitions.clear()
+
+def ensure_raw_seq(conn: sqlite3.Connection):
+    """
+    Creates the single-row id counter shared by every partition, seeded
+    with the highest id handed out so far. The caller commits.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RAW_SEQ_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            seq INTEGER NOT NULL
+        )
+    """)
+    if conn.execute(f"SELECT 1 FROM {RAW_SEQ_TABLE}").fetchone():
+        return
+    top = 0
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_sequence'").fetchone():
+        top = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name LIKE ? OR name = ?",
+            (PARTITION_PREFIX + "%", RAW_VIEW)
+        ).fetchone()[0]
+    conn.execute(f"INSERT INTO {RAW_SEQ_TABLE} (id, seq) VALUES (0, ?)", (top,))
+
+def insert_raw(conn: sqlite3.Connection, rows: list) -> list:
+    """
+    Routes (date_time, temp, hum, lux, gas_pct, press, device_id) tuples to
+    their day partition and returns their ids, in input order. The caller commits.
+
+    Ids are reserved from 'raw_seq' inside the caller's transaction, so a
+    late reading routed to an older day's partition still gets a new,
+    globally increasing id (readers use 'id > cursor' across partitions).
+    """
+    if not rows:
+        return []
+    conn.execute(f"UPDATE {RAW_SEQ_TABLE} SET seq = seq + ? WHERE id = 0", (len(rows),))
+    first = conn.execute(f"SELECT seq FROM {RAW_SEQ_TABLE} WHERE id = 0").fetchone()[0] - len(rows) + 1
+    ids = list(range(first, first + len(rows)))
+
+    by_table = {}
+    for row_id, row in zip(ids, rows):
+        by_table.setdefault(ensure_partition(conn, row[0]), []).append((row_id, *row))
+
+    for table, batch in by_table.items():
+        conn.executemany(f"""
+            INSERT INTO {table} (id, date_time, temp, hum, lux, gas_pct, press, device_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+    return ids
+
+def drop_partitions_before(conn: sqlite3.Connection, day) -> list:
+    """Drops every partition strictly older than 'day'. O(1) per partition."""
+    cutoff = _to_day(day)
+    dropped = []
+    for name in list_partitions(conn):
+        if partition_day(name) < cutoff:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+            _known_partitions.discard(name)
+            dropped.append(name)
+    if dropped:
+        conn.execute(
+            f"DELETE FROM sqlite_sequence WHERE name IN ({','.join('?' * len(dropped))})", dropped
+        )
+        rebuild_view(conn)
+    conn.commit()
+    return dropped
+
+def ensure_raw_schema(conn: sqlite3.Connection):
+    """
+    Prepares partitioned raw storage.
+
+    Logic:
+    1. Migration: A legacy monolithic 'live_data' table is split into day
+       partitions (ids preserved) and dropped.
+    2. Today: The current day's partition always exists so the view is never empty.
+       Partitions from older releases get any index they are missing.
+    3. Ids: The 'raw_seq' counter is created, seeded past every existing id.
+    """
+    legacy = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name=?", (RAW_VIEW,)
+    ).fetchone()
+
+    if legacy and legacy[0] == "table":
+        days = conn.execute(
+            f"SELECT DISTINCT substr(date_time, 1, 10) FROM {RAW_VIEW} WHERE date_time IS NOT NULL"
+        ).fetchall()
+        for (day,) in days:
+            name = ensure_partition(conn, day, refresh_view=False)
+            conn.execute(f"""
+                INSERT INTO {name} ({RAW_COLUMNS})
+                SELECT {RAW_COLUMNS} FROM {RAW_VIEW} WHERE substr(date_time, 1, 10) = ?
+            """, (day,))
+        ensure_raw_seq(conn)
+        conn.execute(f"DROP TABLE {RAW_VIEW}")
+        _known_partitions.clear()
+
+    ensure_partition(conn, datetime.now())
+    for name in list_partitions(conn):
+        create_partition_indexes(conn, name)
+    ensure_raw_seq(conn)
+    rebuild_view(conn)
+    conn.commit()
+
+def latest_raw(conn: sqlite3.Connection, device_id: int):
+    """Newest raw row for a device, scanning partitions newest first."""
+    for name in reversed(list_partitions(conn)):
+        row = conn.execute(
+            f"SELECT {RAW_COLUMNS} FROM {name} WHERE device_id = ? ORDER BY date_time DESC LIMIT 1",
+            (device_id,)
+        ).fetchone()
+        if row:
+            return row
+    return None
+
+# --- GPS fixes ---
+#
+# Position is only sent while the probe has a fix, so it is kept in its own
+# narrow table instead of widening every raw partition.
+
+GPS_COLUMNS = "date_time, device_id, lat, lon, alt, fix, sats"
+
+def ensure_gps_schema(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS gps_data (
+            date_time TEXT NOT NULL,
+            device_id INTEGER NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            alt REAL,
+            fix INTEGER,
+            sats INTEGER,
+            PRIMARY KEY (device_id, date_time)
+        )
+    """)
+
+def insert_gps(conn: sqlite3.Connection, rows: list):
+    """Stores (date_time, device_id, lat, lon, alt, fix, sats) tuples. The caller commits."""
+    conn.executemany(f"INSERT OR REPLACE INTO gps_data ({GPS_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+def latest_gps(conn: sqlite3.Connection, device_id: int):
+    return conn.execute(
+        f"SELECT {GPS_COLUMNS} FROM gps_data WHERE device_id = ? ORDER BY date_time DESC LIMIT 1", (device_id,)
+    ).fetchone()
+
+def hours_back(now: datetime, hours: int) -> date:
+    """First day whose partition may still hold rows newer than now - hours."""
+    return (now - timedelta(hours=hours)).date()
@@ -5,8 +5,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from routes.api_routes import api_bp
 from routes.data_routes import data_bp
+from routes.export_routes import export_bp
+from routes.event_routes import event_bp
+from routes.stats_routes import stats_bp
+from routes.asset_routes import asset_bp
 import threading
-from services.data_services import ensure_schema, db_manager
+from services.data_services import ensure_schema, open_db, hot_window
+from services.maintenance import db_manager
+from shared.leader import start_leader_thread
 
 threads = []
 
@@ -14,9 +20,16 @@ app = Flask(__name__)
 
 app.register_blueprint(api_bp)
 app.register_blueprint(data_bp)
+app.register_blueprint(export_bp)
+app.register_blueprint(event_bp)
+app.register_blueprint(stats_bp)
+app.register_blueprint(asset_bp)
 
 if __name__ == '__main__':
     if not ensure_schema():
         exit()
-    threading.Thread(target=db_manager, daemon=True).start()
+    with open_db() as conn:
+        hot_window.warm(conn)
+    # The debug reloader runs two processes; only the lock holder maintains the DB
+    start_leader_thread(db_manager)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.asset_services import build_assets
+
+# Build step for static files: run after changing anything under static/.
+# Running servers pick up the new manifest on the next request.
+
+if __name__ == '__main__':
+    build_assets()
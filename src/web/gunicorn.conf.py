@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shared.config import WEB_WORKERS
+
+bind = os.environ.get("GREENSAT_BIND", "0.0.0.0:5000")
+# Not cpu*2+1: every worker keeps its own hot window and detector (WEB_WORKERS)
+workers = WEB_WORKERS
+threads = int(os.environ.get("GREENSAT_THREADS", 4))
+worker_class = "gthread"
+timeout = 60
+# Workers import the app after fork so no SQLite handle crosses a fork
+preload_app = False
+
+def on_starting(server):
+    """Runs once in the master before any worker is forked (the only schema check under gunicorn)."""
+    from services.data_services import ensure_schema
+    if not ensure_schema():
+        sys.exit(1)
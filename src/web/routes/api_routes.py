@@ -1,7 +1,16 @@
 import os
 import sqlite3
-from flask import Blueprint, render_template, jsonify, request
-from services.data_services import open_db
+from flask import Blueprint, Response, render_template, jsonify, request
+from services.data_services import (
+    open_db, latest_raw, partitions_for_range, union_source, read_chunked, wal_manager, query_cache,
+    TIERS, DEFAULT_POINT_BUDGET, select_tier, hot_window
+)
+from services.maintenance import scheduler, published_status
+from shared.leader import is_leader, leader_pid
+from services.archive_services import archived_history
+from shared.raw_store import GPS_COLUMNS, latest_gps
+from shared.config import HOT_WINDOW_HOURS
+from services.ingest_services import gap_stats
 
 # Define the blueprint
 api_bp = Blueprint('api', __name__)
@@ -27,45 +36,192 @@ def api_data():
     device_id = request.args.get('sonde', 1, type=int)
     conn = open_db()
     if not conn: return jsonify({"error": "DB Link Down"}), 500
-    row = conn.execute('SELECT * FROM live_data WHERE device_id = ? ORDER BY date_time DESC LIMIT 1', (device_id,)).fetchone()
+    row = hot_window.latest(conn, device_id) or latest_raw(conn, device_id)
+    fix = latest_gps(conn, device_id)
     conn.close()
-    return jsonify(dict(row)) if row else (jsonify({"error": "Data not found!"}), 200)
+    if not row:
+        return jsonify({"error": "Data not found!"}), 200
+    data = dict(row)
+    data["gps"] = dict(fix) if fix else None
+    return jsonify(data)
+
+@api_bp.route('/api/gps')
+def api_gps():
+    """GPS track of one device over [start, end] (default: the last fixes)."""
+    device_id = request.args.get('sonde', 1, type=int)
+    start = request.args.get('start', '')
+    end = request.args.get('end', '9999')
+    limit = min(request.args.get('limit', 1000, type=int), 100000)
+    conn = open_db()
+    if not conn: return jsonify({"error": "DB Link Down"}), 500
+    rows = conn.execute(
+        f"SELECT {GPS_COLUMNS} FROM gps_data WHERE device_id=? AND date_time BETWEEN ? AND ? "
+        f"ORDER BY date_time DESC LIMIT ?", (device_id, start, end, limit)
+    ).fetchall()
+    conn.close()
+    return jsonify([dict(r) for r in reversed(rows)])
+
+def hot_history(conn, tier: str, device_id: int, start: str, end: str, since: str):
+    """Raw and minute series served from the in-memory hot window, or None if it does not cover the range."""
+    if tier not in ('raw', 'minute') or device_id is None:
+        return None
+    if since and tier == 'raw' and since.isdigit():
+        return hot_window.history(conn, device_id, start, end, after_id=int(since))
+    lo = since or start
+    if tier == 'raw':
+        rows = hot_window.history(conn, device_id, lo, end)
+    else:
+        rows = hot_window.downsample(conn, device_id, lo, end, TIERS['minute'][1])
+    if rows is not None and since:
+        rows = [r for r in rows if r["date_time"] > since]
+    return rows
 
 @api_bp.route('/api/history')
 def api_history():
+    """
+    Series for one device over [start, end].
+    The tier is chosen from the span and the 'points' budget (select_tier);
+    'tier' forces one, and the legacy 'mode' is used only without a range.
+    'since' (a time label, or a raw row id) returns only rows after that
+    cursor; the cursor for the next call is sent in X-GreenSat-Cursor.
+    """
     mode = request.args.get('mode', 'day')
     start_date = request.args.get('start')
     end_date = request.args.get('end')
     device_id = request.args.get('sonde', type=int)
-    
+    points = request.args.get('points', DEFAULT_POINT_BUDGET, type=int)
+    since = request.args.get('since')
+
+    tier = request.args.get('tier')
+    if tier not in TIERS:
+        if start_date and end_date:
+            try:
+                tier = select_tier(start_date, end_date, points)
+            except ValueError:
+                return jsonify({"error": "Invalid date range"}), 400
+        else:
+            tier = {'day': 'raw', 'week': 'hourly', 'month': 'hourly'}.get(mode, 'daily')
+
+    cache_key = ("history", tier, device_id, start_date, end_date)
+    cached = query_cache.get(cache_key, tier, device_id) if not since else None
+    if cached is not None:
+        return Response(cached[0], mimetype='application/json', headers=cached[1])
+
     conn = open_db()
     if not conn: return jsonify({"error": "DB Error"}), 500
 
     mapping = "time_label AS date_time, temp_avg AS temp, hum_avg AS hum, lux_avg AS lux, gas_avg AS gas_pct, press_avg AS press"
 
     try:
+        rows = hot_history(conn, tier, device_id, start_date, end_date, since)
+        if rows is not None:
+            return _history_response(conn, rows, tier, device_id, start_date, end_date, since, cache_key)
+
         args = (device_id, start_date, end_date)
-        
-        # Explicit mapping per viewMode to ensure correct table usage
-        if mode == 'day':
-            query = "SELECT * FROM live_data WHERE device_id=? AND date_time BETWEEN ? AND ? ORDER BY date_time ASC"
-        elif mode in ['week', 'month']:
-            query = f"SELECT {mapping} FROM hourly_history WHERE device_id=? AND time_label BETWEEN ? AND ? ORDER BY time_label ASC"
-        else: # year
-            query = f"SELECT {mapping} FROM daily_history WHERE device_id=? AND time_label BETWEEN ? AND ? ORDER BY time_label ASC"
-
-        rows = conn.execute(query, args).fetchall()
-        conn.close()
-        return jsonify([dict(row) for row in rows])
+        where = "device_id=? AND date_time BETWEEN ? AND ?"
+
+        if tier == 'raw':
+            # Only the day partitions overlapping the range are scanned
+            source = union_source(partitions_for_range(conn, start_date, end_date))
+            keys = ("date_time", "id")
+        else:
+            source = f"(SELECT {mapping}, device_id FROM {TIERS[tier][0]})"
+            keys = ("date_time",)
+
+        if since:
+            # Delta query: only rows after the client's cursor (live charts)
+            if tier == 'raw' and since.isdigit():
+                where += " AND id > ?"
+                args += (int(since),)
+            else:
+                where += " AND date_time > ?"
+                args += (since,)
+            rows = []
+        else:
+            # Older than the hot tables: served from the compressed archive
+            rows = archived_history(conn, tier, device_id, start_date, end_date)
+
+        # Read in short chunks so a long range never pins the WAL
+        for chunk in read_chunked(conn, source, "*", where, args, keys):
+            rows.extend(dict(row) for row in chunk)
+
+        return _history_response(conn, rows, tier, device_id, start_date, end_date, since, cache_key)
     except Exception as e:
         if conn: conn.close()
         return jsonify({"error": str(e)}), 500
 
+def _history_response(conn, rows, tier, device_id, start_date, end_date, since, cache_key):
+    """Serializes a history result, sets the cursor headers, caches full loads and closes 'conn'."""
+    response = jsonify(rows)
+    response.headers["X-GreenSat-Tier"] = tier
+    if rows:
+        last = rows[-1]
+        response.headers["X-GreenSat-Cursor"] = str(last["id"]) if tier == 'raw' and last.get("id") else last["date_time"]
+    elif since or start_date:
+        response.headers["X-GreenSat-Cursor"] = since or start_date
+    if not since:
+        query_cache.put(cache_key, response.get_data(), tier, device_id,
+                        closed=query_cache.is_closed(conn, tier, end_date),
+                        headers={k: v for k, v in response.headers.items() if k.startswith("X-GreenSat")})
+    conn.close()
+    return response
+
 @api_bp.route('/api/limits')
 def api_limits():
     device_id = request.args.get('sonde', 1, type=int)
+    cached = query_cache.get(("limits", device_id), "daily", device_id)
+    if cached is not None:
+        return Response(cached[0], mimetype='application/json')
+
     conn = open_db()
     if not conn: return jsonify({"error": "DB Link Down"}), 500
     row = conn.execute('SELECT MIN(time_label) as first_date FROM daily_history WHERE device_id=?', (device_id,)).fetchone()
     conn.close()
-    return jsonify(dict(row))
\ No newline at end of file
+    response = jsonify(dict(row))
+    query_cache.put(("limits", device_id), response.get_data(), "daily", device_id, closed=False)
+    return response
+
+@api_bp.route('/api/maintenance')
+def api_maintenance():
+    # Only the leader (a worker or run_maintenance.py) runs the scheduler; the
+    # others serve the status it publishes after every tick
+    status = scheduler.status() if is_leader() else (published_status() or {"tasks": []})
+    status.pop("wal", None)
+    status.update({"pid": os.getpid(), "leader": is_leader(), "leader_pid": leader_pid()})
+    return jsonify(status)
+
+@api_bp.route('/api/wal')
+def api_wal():
+    # Checkpoints run in the leader; other processes report its published counters
+    published = None if is_leader() else published_status()
+    if not published:
+        return jsonify(wal_manager.metrics())
+    return jsonify(dict(published["wal"], wal_bytes=wal_manager.wal_size(), updated=published["updated"]))
+
+@api_bp.route('/api/cache')
+def api_cache():
+    return jsonify(dict(query_cache.stats(), hot_window=hot_window.stats()))
+
+@api_bp.route('/api/live')
+def api_live():
+    """Rolling statistics over the last 'seconds' (default 300), from the hot window."""
+    device_id = request.args.get('sonde', 1, type=int)
+    seconds = max(1, min(request.args.get('seconds', 300, type=int), HOT_WINDOW_HOURS * 3600))
+    conn = open_db()
+    if not conn: return jsonify({"error": "DB Link Down"}), 500
+    try:
+        stats = hot_window.live_stats(conn, device_id, seconds)
+    finally:
+        conn.close()
+    return jsonify(stats) if stats else (jsonify({"error": "Data not found!"}), 200)
+
+@api_bp.route('/api/ingest')
+def api_ingest():
+    """Sequence statistics per device: received, duplicates, late, missing, lost, loss_pct."""
+    device_id = request.args.get('sonde', type=int)
+    conn = open_db()
+    if not conn: return jsonify({"error": "DB Link Down"}), 500
+    try:
+        return jsonify(gap_stats(conn, device_id))
+    finally:
+        conn.close()
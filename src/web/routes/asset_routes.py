@@ -0,0 +1,42 @@
+import mimetypes
+import os
+from flask import Blueprint, abort, request, send_file, url_for
+from services.asset_services import BUILD_DIR, hashed_path, pick_encoding
+
+asset_bp = Blueprint('assets', __name__)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def asset_url(filename: str) -> str:
+    """
+    URL of a static file: the fingerprinted build when it exists, the plain
+    /static path otherwise (development without a build).
+    """
+    hashed = hashed_path(filename)
+    if hashed:
+        return url_for('assets.serve_asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+@asset_bp.app_context_processor
+def inject_asset_url():
+    return {"asset_url": asset_url}
+
+@asset_bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """
+    Serves a fingerprinted file with a negotiated precompressed variant.
+    Range requests and conditional GETs are handled by send_file; the byte
+    ranges refer to the selected encoding, as HTTP specifies.
+    """
+    full = os.path.abspath(os.path.join(BUILD_DIR, filename))
+    if not full.startswith(BUILD_DIR + os.sep) or not os.path.isfile(full):
+        abort(404)
+
+    path, encoding = pick_encoding(filename, request.accept_encodings)
+    mimetype = mimetypes.guess_type(full)[0] or 'application/octet-stream'
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
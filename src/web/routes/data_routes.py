@@ -1,39 +1,110 @@
 from flask import Blueprint, request, jsonify
 import sqlite3
 import os
-from datetime import datetime
-from services.data_services import open_db
+from datetime import datetime, timedelta
+from shared.config import INGEST_MAX_BATCH, INGEST_MAX_AGE_SECONDS, INGEST_CLOCK_SKEW_SECONDS
+from services.data_services import open_db, insert_raw, query_cache, hot_window
+from shared.raw_store import insert_gps, forget_partitions
+from services.detection_services import detect_stored
+from services.ingest_services import sequence_tracker
 
 data_bp = Blueprint('data', __name__)
 
+def reading_time(data: dict, now: datetime) -> datetime:
+    """
+    When the packet was measured, so resent batches land at their own time.
+
+    Logic:
+    1. 'age_ms': Milliseconds between the reading and the send, measured on
+       the probe's monotonic clock (needs no RTC). Capped at INGEST_MAX_AGE_SECONDS.
+    2. 'timestamp': Unix epoch from a host with a real clock (the bridge). Only
+       used when it falls inside the accepted window; an unset RTC does not.
+    3. Otherwise the arrival time.
+    """
+    age_ms = data.get("age_ms")
+    if age_ms is not None:
+        return now - timedelta(seconds=min(max(float(age_ms) / 1000, 0), INGEST_MAX_AGE_SECONDS))
+    stamp = data.get("timestamp")
+    if stamp is not None:
+        at = datetime.fromtimestamp(float(stamp))
+        if now - timedelta(seconds=INGEST_MAX_AGE_SECONDS) <= at <= now + timedelta(seconds=INGEST_CLOCK_SKEW_SECONDS):
+            return min(at, now)
+    return now
+
+def ingest_packet(conn, data: dict, now: datetime):
+    """
+    Stores one telemetry packet inside the caller's transaction.
+    Returns the stored row, or None for a duplicate (seq already seen).
+    """
+    # Field mapping
+    temp = data.get("temp_c", data.get("temp", 0))
+    hum  = data.get("humidity", data.get("hum", 0))
+    gas  = data.get("gas_pct", data.get("gas", 0))
+    lux  = data.get("lux", 0)
+    pres = data.get("pressure", data.get("press", 0))
+    device_id = int(data.get("device_id", data.get("id", 0)))
+    lat, lon = data.get("lat"), data.get("lon")
+
+    # Optional sequence number: retries and replays are dropped here
+    seq = data.get("seq")
+    if seq is not None and not sequence_tracker.check(conn, device_id, int(seq), data.get("boot")):
+        return None
+
+    dt_object = reading_time(data, now)
+    formatted_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
+
+    row_id, = insert_raw(conn, [(formatted_time, temp, hum, lux, gas, pres, device_id)])
+    if lat is not None and lon is not None:
+        insert_gps(conn, [(formatted_time, device_id, lat, lon, data.get("alt"),
+                           data.get("gps_fix"), data.get("sats"))])
+    return device_id, row_id, formatted_time, (temp, hum, lux, gas, pres)
+
 @data_bp.route('/upload/raw', methods=['POST'])
 def upload_raw():
+    """
+    Accepts one telemetry packet, or a list of them (batched uploads).
+    Packets carrying 'seq' (and 'boot') are deduplicated, so a client can
+    resend a batch until it sees a 200.
+    """
     data = request.json
     if not data:
         return jsonify({"error": "No data"}), 400
+    packets = data if isinstance(data, list) else [data]
+    if len(packets) > INGEST_MAX_BATCH:
+        return jsonify({"error": f"At most {INGEST_MAX_BATCH} packets per request"}), 413
 
     try:
-        # Field mapping
-        temp = data.get("temp_c", data.get("temp", 0))
-        hum  = data.get("humidity", data.get("hum", 0))
-        gas  = data.get("gas_pct", data.get("gas", 0))
-        lux  = data.get("lux", 0)
-        pres = data.get("pressure", data.get("press", 0))
-        device_id = int(data.get("device_id", data.get("id", 0)))
-
-        # Handle Timestamp: Expecting a Unix epoch (float/int)
-        dt_object = datetime.now() 
-                    
-        formatted_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
+        # Arrival time; each packet is stamped with its own reading time (reading_time)
+        dt_object = datetime.now()
 
+        stored, duplicates = [], 0
         with open_db() as conn:
-            conn.execute("""
-                INSERT INTO live_data (date_time, temp, hum, lux, gas_pct, press, device_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (formatted_time, temp, hum, lux, gas, pres, device_id))
-            conn.commit()
+            # Write lock first, so the sequence check and the insert are atomic across workers
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for packet in packets:
+                    result = ingest_packet(conn, packet, dt_object)
+                    if result is None:
+                        duplicates += 1
+                        continue
+                    stored.append(result)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                sequence_tracker.forget()
+                forget_partitions()
+                raise
+
+            # Streaming detection sees committed rows only
+            events = detect_stored(conn, [row[0] for row in stored])
 
-        return jsonify({"status": "stored", "at": formatted_time}), 200
+        for device_id, row_id, formatted_time, values in stored:
+            query_cache.bump("raw", device_id)
+            hot_window.append(device_id, row_id, formatted_time, values)
+
+        formatted_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
+        return jsonify({"status": "stored", "at": formatted_time, "stored": len(stored),
+                        "duplicates": duplicates, "events": [e["rule"] for e in events]}), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
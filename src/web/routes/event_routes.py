@@ -0,0 +1,64 @@
+import json
+import time
+from flask import Blueprint, Response, jsonify, request
+from services.data_services import open_db, open_db_readonly
+from services.detection_services import detector, query_events
+
+event_bp = Blueprint('events', __name__)
+
+STREAM_POLL_SECONDS = 1
+STREAM_HEARTBEAT_SECONDS = 15
+
+@event_bp.route('/api/events')
+def api_events():
+    """
+    Detection events, oldest first.
+    Query: sonde, since_id (cursor), start, end, severity, limit
+    """
+    limit = min(request.args.get('limit', 500, type=int), 5000)
+    conn = open_db()
+    if not conn: return jsonify({"error": "DB Link Down"}), 500
+    try:
+        rows = query_events(conn, request.args.get('sonde', type=int), request.args.get('since_id', 0, type=int),
+                            request.args.get('start'), request.args.get('end'), request.args.get('severity'), limit)
+    finally:
+        conn.close()
+    return jsonify(rows)
+
+@event_bp.route('/api/events/stream')
+def api_events_stream():
+    """
+    Server-Sent Events feed of new detection events.
+    Resumes after 'since_id' or the browser's Last-Event-ID header.
+    """
+    device_id = request.args.get('sonde', type=int)
+    severity = request.args.get('severity')
+    last_id = request.headers.get('Last-Event-ID', request.args.get('since_id', 0), type=int)
+
+    def stream(last_id):
+        conn = open_db_readonly()
+        idle = 0
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                events = query_events(conn, device_id, last_id, severity=severity, limit=100)
+                for event in events:
+                    last_id = event["id"]
+                    yield f"id: {last_id}\nevent: detection\ndata: {json.dumps(event)}\n\n"
+                idle = 0 if events else idle + STREAM_POLL_SECONDS
+                if idle >= STREAM_HEARTBEAT_SECONDS:
+                    # Comment line keeps proxies from closing an idle stream
+                    idle = 0
+                    yield ": keepalive\n\n"
+                time.sleep(STREAM_POLL_SECONDS)
+        finally:
+            conn.close()
+
+    return Response(stream(last_id), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@event_bp.route('/api/events/state')
+def api_events_state():
+    """Detector baselines (EWMA, rolling min/max) for one device in this process."""
+    device_id = request.args.get('sonde', 1, type=int)
+    return jsonify(detector.snapshot(device_id))
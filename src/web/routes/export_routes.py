@@ -0,0 +1,38 @@
+from flask import Blueprint, Response, jsonify, request
+from services.export_services import TIERS, FORMATS, iter_export_rows, gzip_stream
+
+export_bp = Blueprint('export', __name__)
+
+@export_bp.route('/api/export')
+def api_export():
+    """
+    Streams a tier for a device set and time range.
+    Query: tier=raw|hourly|daily, sonde=1,2 (or repeated), start, end,
+           format=csv|ndjson|columnar, gzip=1
+    """
+    tier = request.args.get('tier', 'hourly')
+    fmt = request.args.get('format', 'csv')
+    if tier not in TIERS:
+        return jsonify({"error": f"Unknown tier '{tier}'"}), 400
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Unknown format '{fmt}'"}), 400
+
+    try:
+        devices = [int(v) for arg in request.args.getlist('sonde') for v in arg.split(',') if v.strip()]
+    except ValueError:
+        return jsonify({"error": "Invalid sonde list"}), 400
+
+    start = request.args.get('start')
+    end = request.args.get('end')
+    compress = request.args.get('gzip', '0') in ('1', 'true')
+
+    writer, mimetype, ext = FORMATS[fmt]
+    stream = writer(tier, iter_export_rows(tier, devices, start, end))
+    filename = f"greensat_{tier}.{ext}"
+    if compress:
+        stream = gzip_stream(stream)
+        mimetype = "application/gzip"
+        filename += ".gz"
+
+    return Response(stream, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
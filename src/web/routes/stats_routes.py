@@ -0,0 +1,64 @@
+from flask import Blueprint, Response, jsonify, request
+from datetime import datetime, timedelta
+from shared.config import STATS_POINT_BUDGET
+from services.data_services import open_db_readonly, query_cache, TIERS, select_tier
+from services.stats_services import METRICS, STATS, compute_stats, array_cache
+
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('/api/stats')
+def api_stats():
+    """
+    Server-side statistics for one metric over a device set.
+    Query: sonde=1,2 (or repeated), metric, start, end (default: last 7 days),
+           tier (default: chosen by span), stats=summary,histogram,profile,
+           degree_hours,correlation, bins, base (degree-hours base value)
+    """
+    metric = request.args.get('metric', 'temp')
+    if metric not in METRICS:
+        return jsonify({"error": f"Unknown metric '{metric}'"}), 400
+    try:
+        devices = sorted({int(v) for arg in request.args.getlist('sonde') for v in arg.split(',') if v.strip()})
+    except ValueError:
+        return jsonify({"error": "Invalid sonde list"}), 400
+    if not devices:
+        return jsonify({"error": "At least one sonde is required"}), 400
+
+    wanted = tuple(s for s in request.args.get('stats', ','.join(STATS)).split(',') if s in STATS)
+    bins = max(1, min(request.args.get('bins', 20, type=int), 1000))
+    base = request.args.get('base', 10.0, type=float)
+
+    now = datetime.now()
+    end = request.args.get('end') or now.strftime("%Y-%m-%d %H:%M:%S")
+    start = request.args.get('start') or (now - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
+    tier = request.args.get('tier')
+    try:
+        if tier not in TIERS:
+            tier = select_tier(start, end, STATS_POINT_BUDGET)
+        if start > end:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "Invalid date range"}), 400
+
+    cache_key = ("stats", tier, tuple(devices), metric, start, end, wanted, bins, base)
+    # Single-device requests follow that device's ingest; sets rely on the open-range TTL
+    owner = devices[0] if len(devices) == 1 else None
+    cached = query_cache.get(cache_key, tier, owner)
+    if cached is not None:
+        return Response(cached[0], mimetype='application/json')
+
+    conn = open_db_readonly()
+    try:
+        result = compute_stats(conn, tier, devices, metric, start, end, wanted, bins, base)
+        response = jsonify(result)
+        query_cache.put(cache_key, response.get_data(), tier, owner,
+                        closed=query_cache.is_closed(conn, tier, end))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+    return response
+
+@stats_bp.route('/api/stats/cache')
+def api_stats_cache():
+    return jsonify(array_cache.stats())
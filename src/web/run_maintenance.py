@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.data_services import ensure_schema
+from services.maintenance import db_manager
+from shared.leader import run_as_leader
+
+# Standalone maintenance process. Start the web workers with
+# GREENSAT_MAINTENANCE=off, or let this process compete for the same leader lock.
+
+if __name__ == '__main__':
+    if not ensure_schema():
+        exit()
+    print("Waiting for maintenance leadership...")
+    run_as_leader(db_manager)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.data_services import ensure_schema
+
+HOST = os.environ.get("GREENSAT_HOST", "0.0.0.0")
+PORT = int(os.environ.get("GREENSAT_PORT", 5000))
+
+if __name__ == '__main__':
+    if sys.platform == "win32":
+        # No fork on Windows: one process, many threads
+        if not ensure_schema():
+            exit()
+        from waitress import serve
+        from wsgi import app
+        serve(app, host=HOST, port=PORT, threads=int(os.environ.get("GREENSAT_THREADS", 16)))
+    else:
+        # gunicorn.conf.py's on_starting hook ensures the schema before forking
+        here = os.path.dirname(os.path.abspath(__file__))
+        os.chdir(here)
+        os.execvp("gunicorn", ["gunicorn", "--config", os.path.join(here, "gunicorn.conf.py"), "wsgi:app"])
@@ -0,0 +1,243 @@
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from shared.config import ARCHIVE_DIR
+from shared.raw_store import list_partitions, partition_day
+
+# --- Compressed cold archive ---
+#
+# Data leaving the hot SQLite tables is packed into append-only segment files,
+# one per tier, device and month: ARCHIVE_DIR/<tier>/<device>/<YYYY-MM>.gsa
+#
+# A segment is a sequence of blocks. Each block has a fixed header
+#   magic 'GSA1', first ts, last ts (int64), row count, payload length (uint32)
+# followed by a zlib payload holding delta-encoded int64 timestamps and one
+# float64 column per measurement. Readers walk the headers (the time index)
+# and only decompress blocks overlapping the requested range.
+
+BLOCK_HEADER = struct.Struct("<4sqqII")
+BLOCK_MAGIC = b"GSA1"
+EPOCH = datetime(1970, 1, 1)
+
+TIER_COLUMNS = {
+    "raw": ("temp", "hum", "lux", "gas_pct", "press"),
+    "hourly": (
+        "temp_min", "temp_max", "temp_avg",
+        "hum_min", "hum_max", "hum_avg",
+        "lux_min", "lux_max", "lux_avg",
+        "gas_min", "gas_max", "gas_avg",
+        "press_min", "press_max", "press_avg",
+        "sample_count",
+    ),
+}
+
+_write_lock = threading.Lock()
+
+def to_ts(label: str) -> int:
+    """Naive local timestamp label -> seconds since 1970 (no timezone shift)."""
+    return int((datetime.fromisoformat(label) - EPOCH).total_seconds())
+
+def from_ts(ts: int) -> str:
+    return (EPOCH + timedelta(seconds=ts)).strftime("%Y-%m-%d %H:%M:%S")
+
+def segment_path(tier: str, device_id: int, month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, tier, str(device_id), f"{month}.gsa")
+
+def _iter_blocks(path: str):
+    """
+    Yields (first_ts, last_ts, rows, payload_offset, payload_len) per block.
+    Stops at the first incomplete block, e.g. one cut short by a crash mid-write.
+    """
+    end = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while True:
+            head = f.read(BLOCK_HEADER.size)
+            if len(head) < BLOCK_HEADER.size:
+                return
+            magic, first, last, rows, size = BLOCK_HEADER.unpack(head)
+            if magic != BLOCK_MAGIC or f.tell() + size > end:
+                return
+            yield first, last, rows, f.tell(), size
+            f.seek(size, os.SEEK_CUR)
+
+def _last_ts(path: str, width: int):
+    """
+    Last archived timestamp of a segment, after repairing its tail.
+
+    Logic:
+    1. Walks the block headers up to the first incomplete block.
+    2. Decodes the final block; if it is corrupt (a torn write), drops it
+       and checks the one before.
+    3. Truncates the file back to the end of the last good block, so the
+       next append does not land after broken bytes.
+    """
+    if not os.path.exists(path):
+        return None
+    blocks = list(_iter_blocks(path))
+    with open(path, "r+b") as f:
+        while blocks:
+            _, last, rows, offset, size = blocks[-1]
+            f.seek(offset)
+            try:
+                _decode(f.read(size), rows, width)
+                break
+            except (zlib.error, ValueError, IndexError):
+                blocks.pop()
+        good_end = blocks[-1][3] + blocks[-1][4] if blocks else 0
+        if good_end < os.path.getsize(path):
+            print(f"Archive: truncating damaged tail of {path} at byte {good_end}")
+            f.truncate(good_end)
+            f.flush()
+            os.fsync(f.fileno())
+    return blocks[-1][1] if blocks else None
+
+def _encode(rows: list, width: int) -> bytes:
+    ts = array("q", (r[0] for r in rows))
+    deltas = array("q", [ts[0]] + [ts[i] - ts[i - 1] for i in range(1, len(ts))])
+    blobs = [deltas.tobytes()]
+    for col in range(1, width + 1):
+        blobs.append(array("d", (float("nan") if r[col] is None else r[col] for r in rows)).tobytes())
+    return zlib.compress(b"".join(blobs), 6)
+
+def _decode(payload: bytes, rows: int, width: int) -> list:
+    data = zlib.decompress(payload)
+    step = rows * 8
+    deltas = array("q")
+    deltas.frombytes(data[:step])
+    ts, acc = [], 0
+    for d in deltas:
+        acc += d
+        ts.append(acc)
+    columns = []
+    for col in range(width):
+        values = array("d")
+        values.frombytes(data[step * (col + 1):step * (col + 2)])
+        columns.append(values)
+    return [(ts[i], *(None if c[i] != c[i] else c[i] for c in columns)) for i in range(rows)]
+
+def append_rows(tier: str, device_id: int, rows: list) -> int:
+    """
+    Archives (time_label, *values) rows for one device; returns rows written.
+
+    Rows are split by month and appended as one block per segment. Rows not
+    newer than a segment's last archived timestamp are skipped, so re-running
+    an interrupted archive pass never duplicates data.
+    """
+    width = len(TIER_COLUMNS[tier])
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[0][:7], []).append((to_ts(row[0]), *row[1:]))
+
+    written = 0
+    with _write_lock:
+        for month, month_rows in by_month.items():
+            path = segment_path(tier, device_id, month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            month_rows.sort(key=lambda r: r[0])
+            last = _last_ts(path, width)
+            if last is not None:
+                month_rows = [r for r in month_rows if r[0] > last]
+            if not month_rows:
+                continue
+            payload = _encode(month_rows, width)
+            with open(path, "ab") as f:
+                f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, month_rows[0][0], month_rows[-1][0],
+                                          len(month_rows), len(payload)))
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            written += len(month_rows)
+    return written
+
+def read_rows(tier: str, device_id: int, start: str, end: str) -> list:
+    """Returns archived (ts, *values) rows with start <= time <= end, oldest first."""
+    width = len(TIER_COLUMNS[tier])
+    lo, hi = to_ts(start), to_ts(end)
+    month = datetime.fromisoformat(start).replace(day=1, hour=0, minute=0, second=0)
+    last_month = datetime.fromisoformat(end)
+
+    out = []
+    while month <= last_month:
+        path = segment_path(tier, device_id, month.strftime("%Y-%m"))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for first, last, rows, offset, size in list(_iter_blocks(path)):
+                    if last < lo or first > hi:
+                        continue
+                    f.seek(offset)
+                    try:
+                        decoded = _decode(f.read(size), rows, width)
+                    except (zlib.error, ValueError, IndexError):
+                        # Torn block at the tail; repaired on the next append
+                        print(f"Archive: skipping damaged block in {path} at byte {offset}")
+                        continue
+                    out.extend(r for r in decoded if lo <= r[0] <= hi)
+        month = (month + timedelta(days=32)).replace(day=1)
+    out.sort(key=lambda r: r[0])
+    return out
+
+# --- Archival stage (called from prune_raw before data is dropped) ---
+
+def archive_partition(conn: sqlite3.Connection, table: str) -> int:
+    """Copies one raw day partition into the raw archive, per device."""
+    written = 0
+    devices = [r[0] for r in conn.execute(f"SELECT DISTINCT device_id FROM {table}").fetchall()]
+    for device_id in devices:
+        rows = conn.execute(
+            f"SELECT date_time, temp, hum, lux, gas_pct, press FROM {table} WHERE device_id=? ORDER BY date_time",
+            (device_id,)
+        ).fetchall()
+        written += append_rows("raw", device_id, [tuple(r) for r in rows])
+    return written
+
+def archive_hourly_before(conn: sqlite3.Connection, cutoff: str) -> int:
+    """Copies hourly_history rows older than 'cutoff' into the hourly archive."""
+    cols = ", ".join(TIER_COLUMNS["hourly"])
+    written = 0
+    devices = [r[0] for r in conn.execute(
+        "SELECT DISTINCT device_id FROM hourly_history WHERE time_label < ?", (cutoff,)).fetchall()]
+    for device_id in devices:
+        rows = conn.execute(
+            f"SELECT time_label, {cols} FROM hourly_history WHERE device_id=? AND time_label < ? ORDER BY time_label",
+            (device_id, cutoff)
+        ).fetchall()
+        written += append_rows("hourly", device_id, [tuple(r) for r in rows])
+    return written
+
+# --- Transparent reads for /api/history ---
+
+def archived_history(conn: sqlite3.Connection, tier: str, device_id: int, start: str, end: str) -> list:
+    """
+    Archived rows for the part of [start, end] older than the hot tables,
+    shaped like the hot query results of the same tier.
+    """
+    if not start or not end or device_id is None:
+        return []
+
+    if tier == 'raw':
+        # Archived raw rows always precede the oldest remaining partition
+        partitions = list_partitions(conn)
+        hot_from = f"{partition_day(partitions[0]):%Y-%m-%d} 00:00:00" if partitions else None
+    elif tier == 'hourly':
+        hot_from = conn.execute("SELECT MIN(time_label) FROM hourly_history WHERE device_id=?", (device_id,)).fetchone()[0]
+    else:
+        return []
+
+    if hot_from and start >= hot_from:
+        return []
+
+    rows = read_rows(tier, device_id, start, end)
+    if hot_from:
+        limit = to_ts(hot_from)
+        rows = [r for r in rows if r[0] < limit]
+
+    if tier == "raw":
+        return [{"id": None, "date_time": from_ts(r[0]), "temp": r[1], "hum": r[2], "lux": r[3],
+                 "gas_pct": r[4], "press": r[5], "device_id": device_id} for r in rows]
+    # Same projection as the hourly mapping: averages only
+    return [{"date_time": from_ts(r[0]), "temp": r[3], "hum": r[6], "lux": r[9],
+             "gas_pct": r[12], "press": r[15], "device_id": device_id} for r in rows]
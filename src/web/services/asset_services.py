@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Fingerprinted, precompressed static assets ---
+#
+# build_assets() copies every file under static/ to static/build/ with a
+# content hash in its name (js/main.js -> js/main.3f2a9c1d0b.js) and writes
+# .gz/.br siblings for compressible types. The manifest maps logical names to
+# hashed ones; templates resolve URLs through asset_url(), so a hashed URL
+# never changes content and can be cached forever by browsers and proxies.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'build')
+MANIFEST_PATH = os.path.join(BUILD_DIR, 'manifest.json')
+
+HASH_LENGTH = 10
+COMPRESSIBLE = {'.js', '.css', '.html', '.json', '.svg', '.txt', '.map', '.gltf', '.obj', '.mtl', '.glb', '.bin', '.wasm'}
+MIN_COMPRESS_BYTES = 1024
+MIN_SAVING = 0.1            # Variants saving less than 10% are not written
+
+# Preference when the client accepts several: smallest first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest = {"mtime": None, "files": {}}
+_manifest_lock = threading.Lock()
+
+def _fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+def _write_variant(path: str, data: bytes, compressed: bytes, suffix: str) -> bool:
+    if len(compressed) > len(data) * (1 - MIN_SAVING):
+        return False
+    with open(path + suffix, 'wb') as f:
+        f.write(compressed)
+    return True
+
+def build_assets(verbose: bool = True) -> dict:
+    """
+    Rebuilds static/build/ and its manifest. Returns the manifest.
+
+    Logic:
+    1. Fingerprint: The output name carries the first HASH_LENGTH hex
+       digits of the file's SHA-256.
+    2. Precompress: Compressible files get a gzip (level 9) and, when the
+       optional 'brotli' package is installed, a brotli (quality 11) variant.
+    3. Swap: The manifest is written last, so running servers switch to the
+       new names only once every file is in place. Old hashed files are kept
+       for clients that still reference them.
+    """
+    files = {}
+    for root, dirs, names in os.walk(STATIC_DIR):
+        if os.path.abspath(root).startswith(BUILD_DIR):
+            dirs[:] = []
+            continue
+        for name in sorted(names):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, STATIC_DIR).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = f"{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(BUILD_DIR, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                shutil.copyfile(source, target)
+
+            variants = []
+            if ext.lower() in COMPRESSIBLE and os.path.getsize(source) >= MIN_COMPRESS_BYTES:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                if os.path.exists(target + '.gz') or _write_variant(target, data, gzip.compress(data, 9, mtime=0), '.gz'):
+                    variants.append('gzip')
+                if brotli and (os.path.exists(target + '.br') or
+                               _write_variant(target, data, brotli.compress(data, quality=11), '.br')):
+                    variants.append('br')
+            files[logical] = {"path": hashed, "encodings": variants}
+            if verbose:
+                print(f"{logical} -> {hashed} {' '.join(variants)}")
+
+    tmp = MANIFEST_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({"files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+    if brotli is None and verbose:
+        print("brotli not installed: only gzip variants were written")
+    return files
+
+def load_manifest() -> dict:
+    """Logical name -> {path, encodings}; reloaded when the build changes."""
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        return {}
+    with _manifest_lock:
+        if _manifest["mtime"] != mtime:
+            try:
+                with open(MANIFEST_PATH) as f:
+                    _manifest["files"] = json.load(f)["files"]
+                _manifest["mtime"] = mtime
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Asset manifest unreadable: {e}")
+                return {}
+        return _manifest["files"]
+
+def hashed_path(filename: str):
+    entry = load_manifest().get(filename)
+    return entry["path"] if entry else None
+
+def pick_encoding(filename: str, accept_encodings) -> tuple:
+    """
+    Chooses the stored variant for a hashed file: (path on disk, encoding).
+    'accept_encodings' is the request's parsed Accept-Encoding header.
+    """
+    path = os.path.join(BUILD_DIR, filename)
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] > 0 and os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return path, None
@@ -1,44 +1,42 @@
+import os
 import sqlite3
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
 import time
-from shared.config import DB_PATH
+import numpy as np
+from shared.config import (
+    DB_PATH, WAL_AUTOCHECKPOINT_PAGES, JOURNAL_SIZE_LIMIT_BYTES, WAL_RESTART_BYTES,
+    WAL_TRUNCATE_BYTES, READ_CHUNK_ROWS, MAX_READ_TXN_SECONDS, ARCHIVE_ENABLED,
+    CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_OPEN_TTL_SECONDS, HOT_WINDOW_HOURS, HOT_WINDOW_MAX_BYTES,
+    HOT_SYNC_SECONDS, HOT_RING_IDLE_SECONDS, INGEST_MAX_AGE_SECONDS, WEB_WORKERS
+)
+from shared.raw_store import (
+    ensure_raw_schema, partitions_for_range, union_source, drop_partitions_before, hours_back,
+    insert_raw, latest_raw, list_partitions, partition_day, ensure_gps_schema
+)
+from services.archive_services import archive_partition, archive_hourly_before
+from services.detection_services import ensure_events_table
+from services.ingest_services import ensure_seq_table
 threads = []
 
-# --- Aggregation and Maintenance Scripts ---
-
-import time
-from datetime import datetime, timedelta
+RAW_RETENTION_HOURS = 48
+MINUTE_RETENTION_DAYS = 14
+HOURLY_RETENTION_DAYS = 90
+PRUNE_BATCH_ROWS = 5000                     # Rows per DELETE transaction while pruning
 
-def db_manager():
-    """
-    Handles schema maintenance and hourly aggregations.
-    Execution occurs immediately upon startup and synchronizes to the next hour.
-    """
-    initial_run = True
+# Rollup tiers, finest first: (table, seconds per point)
+TIERS = {
+    "raw": ("live_data", 1),
+    "minute": ("minute_history", 60),
+    "hourly": ("hourly_history", 3600),
+    "daily": ("daily_history", 86400),
+}
+DEFAULT_POINT_BUDGET = 2000
 
-    while True:
-        now = datetime.now()
-
-        if not initial_run:
-            # Calculate seconds until the next hour
-            next_hour = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
-            sleep_duration = (next_hour - now).total_seconds()
-            time.sleep(sleep_duration)
-            now = datetime.now()
-        
-        try:
-            with open_db() as conn:
-                aggregate_hours(conn)
-                aggregate_days(conn)
-                prune_raw(conn)
-                
-                if now.hour == 0:
-                    maybe_vacuum(conn)
-        except Exception as e:
-            # Log error to stderr; avoid terminating the thread
-            print(f"Database maintenance failure at {now}: {e}")
-        
-        initial_run = False
+# --- Aggregation and Maintenance Scripts ---
+# Scheduling lives in services/maintenance.py; this module provides the tasks.
 
 # Helpers
 
@@ -48,25 +46,730 @@ def open_db():
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT_PAGES};")
+    conn.execute(f"PRAGMA journal_size_limit={JOURNAL_SIZE_LIMIT_BYTES};")
     return conn
 
-def prune_raw(conn: sqlite3.Connection):
+def open_db_readonly():
+    """Read-only connection for bulk readers; it can never take the write lock."""
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=20, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# --- WAL Management ---
+
+class WalManager:
+    """
+    Keeps the -wal file bounded under continuous ingest and long readers.
+
+    Logic:
+    1. PASSIVE first: Every run starts with a PASSIVE checkpoint, which never
+       blocks. If it leaves frames behind (checkpointed < log_frames) or is
+       busy, a reader in some process still pins them, so the run stops there.
+       This is the only signal that covers readers in other workers and in
+       run_maintenance.py; reading() only counts this process's readers.
+    2. Escalation: Only when nothing is pinned (and no in-process read is
+       active) does it follow up with RESTART once the WAL passes
+       WAL_RESTART_BYTES, or TRUNCATE past WAL_TRUNCATE_BYTES.
+    3. Blocking modes use a short busy timeout, so a reader that starts in
+       between delays writers by at most that long.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active_reads = 0
+        self.longest_read_s = 0.0
+        self.runs = {"PASSIVE": 0, "RESTART": 0, "TRUNCATE": 0}
+        self.busy = 0
+        self.pinned = 0
+        self.last = None
+
+    def wal_size(self) -> int:
+        try:
+            return os.path.getsize(DB_PATH + "-wal")
+        except OSError:
+            return 0
+
+    @contextmanager
+    def reading(self):
+        start = time.monotonic()
+        with self.lock:
+            self.active_reads += 1
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.active_reads -= 1
+                self.longest_read_s = max(self.longest_read_s, elapsed)
+
+    def choose_mode(self, wal_bytes: int, passive: dict) -> str:
+        """Mode to follow a PASSIVE run with; PASSIVE means stop there."""
+        with self.lock:
+            readers = self.active_reads
+        if readers or passive["busy"] or passive["checkpointed"] < passive["log_frames"]:
+            return "PASSIVE"
+        if wal_bytes >= WAL_TRUNCATE_BYTES:
+            return "TRUNCATE"
+        if wal_bytes >= WAL_RESTART_BYTES:
+            return "RESTART"
+        return "PASSIVE"
+
+    def checkpoint(self, conn: sqlite3.Connection) -> dict:
+        before = self.wal_size()
+        result = checkpoint_wal(conn, "PASSIVE")
+        pinned = result["busy"] or result["checkpointed"] < result["log_frames"]
+        mode = self.choose_mode(before, result)
+        if mode != "PASSIVE":
+            conn.execute("PRAGMA busy_timeout=200")
+            try:
+                result = checkpoint_wal(conn, mode)
+            finally:
+                conn.execute("PRAGMA busy_timeout=20000")
+
+        result.update({"wal_bytes_before": before, "wal_bytes_after": self.wal_size(), "pinned": bool(pinned),
+                       "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        with self.lock:
+            self.runs["PASSIVE"] += 1
+            if mode != "PASSIVE":
+                self.runs[mode] += 1
+            if result["busy"]:
+                self.busy += 1
+            if pinned:
+                self.pinned += 1
+            self.last = result
+        return result
+
+    def metrics(self) -> dict:
+        with self.lock:
+            return {
+                "wal_bytes": self.wal_size(),
+                "active_reads": self.active_reads,
+                "longest_read_s": round(self.longest_read_s, 3),
+                "checkpoints": dict(self.runs),
+                "busy_checkpoints": self.busy,
+                "pinned_checkpoints": self.pinned,
+                "last_checkpoint": self.last,
+                "wal_autocheckpoint_pages": WAL_AUTOCHECKPOINT_PAGES,
+                "journal_size_limit_bytes": JOURNAL_SIZE_LIMIT_BYTES,
+            }
+
+wal_manager = WalManager()
+
+def read_chunked(conn: sqlite3.Connection, source: str, columns: str, where: str, params: tuple,
+                 keys: tuple, chunk_rows: int = READ_CHUNK_ROWS):
+    """
+    Yields lists of rows ordered by 'keys', one short statement per chunk.
+
+    Keyset pagination on the (unique) key columns means no read transaction
+    outlives a single chunk, so checkpoints can make progress between chunks.
+    The chunk size halves whenever a chunk takes longer than MAX_READ_TXN_SECONDS,
+    unless the last halving did not make chunks faster: then the time goes to
+    the statement's plan (a scan or sort), not to rows, and the size is restored.
+    """
+    key_list = ", ".join(keys)
+    marks = ", ".join("?" * len(keys))
+    last = None
+    slow = None            # Elapsed time of the previous slow chunk, if the last one was slow
+    can_shrink = True
+    while True:
+        cond = where if last is None else f"{where} AND ({key_list}) > ({marks})"
+        args = params if last is None else (*params, *last)
+        limit = chunk_rows
+        start = time.monotonic()
+        # Only the statement counts as a read: a slow consumer between
+        # chunks holds no snapshot and must not keep checkpoints passive
+        with wal_manager.reading():
+            rows = conn.execute(
+                f"SELECT {columns} FROM {source} WHERE {cond} ORDER BY {key_list} ASC LIMIT ?",
+                (*args, limit)
+            ).fetchall()
+        elapsed = time.monotonic() - start
+        if elapsed <= MAX_READ_TXN_SECONDS or len(rows) < limit:
+            slow = None
+        elif slow is not None and elapsed > slow * 0.75:
+            # Half the rows took about as long: smaller chunks only add statements
+            chunk_rows, can_shrink, slow = chunk_rows * 2, False, None
+        elif can_shrink and chunk_rows > 100:
+            chunk_rows //= 2
+            slow = elapsed
+        if not rows:
+            break
+        yield rows
+        if len(rows) < limit:
+            break
+        last = tuple(rows[-1][k] for k in keys)
+
+# --- Query Result Cache ---
+
+class QueryCache:
+    """
+    In-process LRU cache of serialized API results.
+
+    Logic:
+    1. Closed ranges: Results whose range ends before the tier's watermark
+       can no longer change and stay cached until evicted.
+    2. Open ranges: Results are tagged with the tier/device generation at
+       store time. Ingest and the aggregation runs bump generations, which
+       invalidates them; CACHE_OPEN_TTL_SECONDS also bounds staleness for
+       writes made by other processes.
+    3. Size: Bounded by entry count and total payload bytes (LRU eviction).
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, open_ttl=CACHE_OPEN_TTL_SECONDS):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl
+        self.bytes = 0
+        self.generations = {}
+        self.watermarks = {}
+        self.stats_counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _generation(self, tier, device_id):
+        return (self.generations.get((tier, None), 0), self.generations.get((tier, device_id), 0))
+
+    def bump(self, tier: str, device_id=None):
+        """Marks open ranges of a tier (or one device in it) as stale."""
+        with self.lock:
+            key = (tier, device_id)
+            self.generations[key] = self.generations.get(key, 0) + 1
+            if device_id is None:
+                self.watermarks.pop(tier, None)
+
+    def watermark(self, conn: sqlite3.Connection, tier: str):
+        """
+        Label before which a tier is final. Raw rows are stamped with their
+        reading time, at most INGEST_MAX_AGE_SECONDS in the past, so anything
+        older than that (plus a couple of seconds) is final. Rollups recompute
+        the windows such late rows can reach, so the same margin (plus one
+        window) applies below their newest label.
+        """
+        if tier == "raw":
+            return (datetime.now() - timedelta(seconds=INGEST_MAX_AGE_SECONDS + 2)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            cached = self.watermarks.get(tier)
+        if cached and time.monotonic() - cached[1] < 30:
+            return cached[0]
+        table, step = TIERS[tier]
+        mark = conn.execute(f"SELECT datetime(MAX(time_label), ?) FROM {table}",
+                            (f"-{INGEST_MAX_AGE_SECONDS + step} seconds",)).fetchone()[0]
+        with self.lock:
+            self.watermarks[tier] = (mark, time.monotonic())
+        return mark
+
+    def is_closed(self, conn: sqlite3.Connection, tier: str, end) -> bool:
+        mark = self.watermark(conn, tier)
+        return bool(end and mark and end < mark)
+
+    def get(self, key, tier: str, device_id):
+        """Returns (payload, headers) or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                _, _, generation, stored_at = entry
+                if generation is not None and (generation != self._generation(tier, device_id)
+                                               or time.monotonic() - stored_at > self.open_ttl):
+                    self._remove(key)
+                    self.stats_counters["invalidations"] += 1
+                    entry = None
+            if entry is None:
+                self.stats_counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats_counters["hits"] += 1
+            return entry[0], entry[1]
+
+    def put(self, key, payload: bytes, tier: str, device_id, closed: bool, headers: dict = None):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            generation = None if closed else self._generation(tier, device_id)
+            self.entries[key] = (payload, headers or {}, generation, time.monotonic())
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats_counters["evictions"] += 1
+
+    def _remove(self, key):
+        payload = self.entries.pop(key)[0]
+        self.bytes -= len(payload)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.stats_counters["hits"] + self.stats_counters["misses"]
+            return {
+                **self.stats_counters,
+                "hit_rate": round(self.stats_counters["hits"] / total, 3) if total else None,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+query_cache = QueryCache()
+
+# --- In-memory Hot Window ---
+
+HOT_METRICS = ("temp", "hum", "lux", "gas_pct", "press")
+HOT_ROW_BYTES = 8 + 8 + 8 * len(HOT_METRICS)    # ts, id, one float64 per metric
+HOT_INITIAL_ROWS = 1024
+
+def label_to_ts(labels) -> np.ndarray:
+    """Naive 'YYYY-MM-DD HH:MM:SS' labels -> int64 seconds (no timezone shift)."""
+    return np.array(labels, dtype="datetime64[s]").astype(np.int64)
+
+def ts_to_labels(ts: np.ndarray) -> list:
+    return [s.replace("T", " ") for s in np.datetime_as_string(ts.astype("datetime64[s]"), unit="s").tolist()]
+
+class DeviceRing:
+    """
+    Recent samples of one device in typed columns: int64 timestamps and ids,
+    a float64 (rows x metrics) block. Grows by doubling, then wraps.
+    """
+    def __init__(self, capacity: int):
+        self.ts = np.zeros(capacity, np.int64)
+        self.ids = np.zeros(capacity, np.int64)
+        self.values = np.zeros((capacity, len(HOT_METRICS)), np.float64)
+        self.head = 0
+        self.size = 0
+        self.complete_since = None   # Every row at or after this ts is held
+        self.synced_id = None        # Highest id seen through sync()
+        self.local_ids = set()       # Ids appended by this process after the last sync
+        self.last_sync = 0.0
+        self.last_used = time.monotonic()
+
+    @property
+    def capacity(self) -> int:
+        return len(self.ts)
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * HOT_ROW_BYTES
+
+    def grow(self, capacity: int):
+        order = self._order()
+        ts, ids, values = np.zeros(capacity, np.int64), np.zeros(capacity, np.int64), \
+            np.zeros((capacity, len(HOT_METRICS)), np.float64)
+        ts[:self.size], ids[:self.size], values[:self.size] = self.ts[order], self.ids[order], self.values[order]
+        self.ts, self.ids, self.values, self.head = ts, ids, values, 0
+
+    def expire(self, cutoff: int):
+        """Drops rows older than 'cutoff' from the head."""
+        while self.size and self.ts[self.head] < cutoff:
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+        if self.complete_since is not None and self.complete_since < cutoff:
+            self.complete_since = cutoff
+
+    def push(self, row_id: int, ts: int, values):
+        if self.size == self.capacity:
+            # Full: the oldest row is overwritten, so completeness starts after it
+            self.complete_since = max(self.complete_since or 0, int(self.ts[self.head]) + 1)
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+        pos = (self.head + self.size) % self.capacity
+        self.ts[pos] = ts
+        self.ids[pos] = row_id
+        self.values[pos] = values
+        self.size += 1
+
+    def _order(self) -> np.ndarray:
+        return (self.head + np.arange(self.size)) % self.capacity
+
+    def select(self, lo: int, hi: int, after_id: int = None):
+        """(ts, ids, values) with lo <= ts <= hi, ordered by (ts, id)."""
+        order = self._order()
+        ts = self.ts[order]
+        mask = (ts >= lo) & (ts <= hi)
+        if after_id is not None:
+            mask &= self.ids[order] > after_id
+        idx = order[mask]
+        sort = np.lexsort((self.ids[idx], self.ts[idx]))
+        idx = idx[sort]
+        return self.ts[idx], self.ids[idx], self.values[idx]
+
+class HotWindow:
+    """
+    Per-device ring buffers holding the last HOT_WINDOW_HOURS of raw samples.
+
+    Logic:
+    1. Fill: upload_raw pushes every committed sample (append). Rows written
+       by other worker processes are pulled with a small 'id > last' query at
+       most every HOT_SYNC_SECONDS (sync); the first sync warm-loads the window.
+    2. Memory: Rings start small and double up to this process's share of
+       HOT_WINDOW_MAX_BYTES (divided by WEB_WORKERS) across all devices; a ring that cannot grow wraps, and its
+       'complete_since' moves forward accordingly.
+    3. Coverage: A query is served from memory only if the ring holds every
+       row of the requested range (start >= complete_since); otherwise the
+       caller falls back to SQLite.
+    4. Allocation: A ring is only created for a device that has rows (an
+       append, or a sync that finds some), so querying unknown ids costs no
+       memory. When the budget is short, empty rings and then rings unused
+       for HOT_RING_IDLE_SECONDS are evicted, least recently used first.
+    """
+    def __init__(self, hours=HOT_WINDOW_HOURS, max_bytes=HOT_WINDOW_MAX_BYTES // WEB_WORKERS,
+                 sync_seconds=HOT_SYNC_SECONDS):
+        self.hours = hours
+        self.max_bytes = max_bytes
+        self.sync_seconds = sync_seconds
+        self.rings = {}
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "syncs": 0, "synced_rows": 0, "wraps": 0, "evictions": 0}
+
+    def _cutoff(self) -> int:
+        return int(label_to_ts([(datetime.now() - timedelta(hours=self.hours)).strftime("%Y-%m-%d %H:%M:%S")])[0])
+
+    def _ring(self, device_id: int, create: bool = False):
+        ring = self.rings.get(device_id)
+        if ring is None and create and self._reserve(HOT_INITIAL_ROWS * HOT_ROW_BYTES):
+            ring = self.rings[device_id] = DeviceRing(HOT_INITIAL_ROWS)
+        if ring is not None:
+            ring.last_used = time.monotonic()
+        return ring
+
+    def _total_bytes(self) -> int:
+        return sum(r.nbytes for r in self.rings.values())
+
+    def _reserve(self, nbytes: int, keep: DeviceRing = None) -> bool:
+        """
+        True once 'nbytes' more fit in the budget. Evicts rings that are
+        empty after expiry, then rings idle for HOT_RING_IDLE_SECONDS,
+        least recently used first; 'keep' (the ring asking) is never evicted.
+        """
+        if self._total_bytes() + nbytes <= self.max_bytes:
+            return True
+        cutoff, now = self._cutoff(), time.monotonic()
+        for ring in self.rings.values():
+            ring.expire(cutoff)
+        candidates = sorted(self.rings.items(), key=lambda item: (item[1].size > 0, item[1].last_used))
+        for device_id, ring in candidates:
+            if ring is keep or (ring.size and now - ring.last_used < HOT_RING_IDLE_SECONDS):
+                continue
+            del self.rings[device_id]
+            self.counters["evictions"] += 1
+            if self._total_bytes() + nbytes <= self.max_bytes:
+                return True
+        return False
+
+    def _push(self, ring: DeviceRing, row_id: int, ts: int, values):
+        if ring.size == ring.capacity:
+            if self._reserve(ring.nbytes, keep=ring):
+                ring.grow(ring.capacity * 2)
+            else:
+                self.counters["wraps"] += 1
+        ring.push(row_id, ts, values)
+
+    def append(self, device_id: int, row_id: int, label: str, values):
+        """Adds a sample this process just committed."""
+        with self.lock:
+            ring = self._ring(device_id, create=True)
+            if ring is None:
+                return
+            # A sync() between the commit and this call already pulled the row:
+            # writers are serialized, so every committed id <= synced_id was read
+            if ring.synced_id is not None and row_id <= ring.synced_id:
+                return
+            cutoff = self._cutoff()
+            ts = int(label_to_ts([label])[0])
+            ring.expire(cutoff)
+            if ts < cutoff:
+                # A late reading already outside the window
+                return
+            ring.local_ids.add(row_id)
+            self._push(ring, row_id, ts, [float(v) if v is not None else np.nan for v in values])
+
+    def sync(self, conn: sqlite3.Connection, device_id: int, force: bool = False):
+        """
+        Pulls rows other processes inserted since the last sync. The first
+        call loads the whole window (warm load); a device without rows in
+        the window gets no ring and returns None.
+        """
+        with self.lock:
+            ring = self._ring(device_id)
+            if ring is not None:
+                if not force and time.monotonic() - ring.last_sync < self.sync_seconds:
+                    return ring
+                ring.last_sync = time.monotonic()
+            cutoff = self._cutoff()
+            cutoff_label = ts_to_labels(np.array([cutoff]))[0]
+            synced_id = ring.synced_id if ring is not None else None
+
+        partitions = partitions_for_range(conn, cutoff_label, None)
+        source = union_source(partitions)
+        if synced_id is None:
+            if ring is None:
+                if conn.execute(f"SELECT 1 FROM {source} WHERE device_id = ? AND date_time >= ? LIMIT 1",
+                                (device_id, cutoff_label)).fetchone() is None:
+                    return None
+                with self.lock:
+                    # No room even after eviction: skip the warm load, callers use SQLite
+                    if not self._reserve(HOT_INITIAL_ROWS * HOT_ROW_BYTES):
+                        return None
+            # Warm load: everything inside the window, up to a fixed id
+            top = conn.execute(f"SELECT MAX(id) FROM {source}").fetchone()[0] or 0
+            where, params = "device_id = ? AND date_time >= ? AND id <= ?", (device_id, cutoff_label, top)
+            keys = ("date_time", "id")
+        else:
+            top = None
+            where, params = "device_id = ? AND id > ?", (device_id, synced_id)
+            keys = ("id",)
+
+        rows = []
+        for chunk in read_chunked(conn, source, "id, date_time, temp, hum, lux, gas_pct, press", where, params, keys):
+            rows.extend(chunk)
+
+        with self.lock:
+            if ring is None:
+                ring = self._ring(device_id, create=True)
+                # No room, or a concurrent sync already warm-loaded it
+                if ring is None or ring.synced_id is not None:
+                    return ring
+                ring.last_sync = time.monotonic()
+            self.counters["syncs"] += 1
+            self.counters["synced_rows"] += len(rows)
+            if synced_id is None:
+                ring.complete_since = cutoff
+            if rows:
+                labels = label_to_ts([r["date_time"] for r in rows])
+                for row, ts in zip(rows, labels):
+                    if row["id"] in ring.local_ids:
+                        continue
+                    self._push(ring, row["id"], int(ts), [np.nan if row[m] is None else row[m] for m in HOT_METRICS])
+                top = max(r["id"] for r in rows) if top is None else top
+            if top is not None:
+                ring.synced_id = max(top, ring.synced_id or 0)
+                ring.local_ids = {i for i in ring.local_ids if i > ring.synced_id}
+            ring.expire(cutoff)
+        return ring
+
+    def warm(self, conn: sqlite3.Connection):
+        """Startup: loads the window for every device seen in it."""
+        cutoff_label = (datetime.now() - timedelta(hours=self.hours)).strftime("%Y-%m-%d %H:%M:%S")
+        source = union_source(partitions_for_range(conn, cutoff_label, None))
+        devices = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT device_id FROM {source} WHERE date_time >= ?", (cutoff_label,)).fetchall()]
+        for device_id in devices:
+            self.sync(conn, device_id, force=True)
+        return len(devices)
+
+    def _covered(self, conn, device_id: int, start: str):
+        ring = self.sync(conn, device_id)
+        if ring is None or ring.complete_since is None or not start:
+            return None
+        if int(label_to_ts([start])[0]) < ring.complete_since:
+            return None
+        return ring
+
+    def history(self, conn, device_id: int, start: str, end: str, after_id: int = None):
+        """Raw rows for [start, end] (optionally id > after_id), or None when not covered."""
+        ring = self._covered(conn, device_id, start)
+        with self.lock:
+            if ring is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            ts, ids, values = ring.select(int(label_to_ts([start])[0]), int(label_to_ts([end or "9999-12-31 23:59:59"])[0]), after_id)
+        columns = {m: values[:, i] for i, m in enumerate(HOT_METRICS)}
+        return _rows(ts_to_labels(ts), columns, device_id, ids.tolist())
+
+    def downsample(self, conn, device_id: int, start: str, end: str, step: int):
+        """
+        Bucket means over [start, end] with 'step' seconds per bucket, shaped
+        like the rollup tiers. Only complete buckets are returned, matching
+        what aggregation would later store.
+        """
+        ring = self._covered(conn, device_id, start)
+        with self.lock:
+            if ring is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            now_bucket = int(label_to_ts([datetime.now().strftime("%Y-%m-%d %H:%M:%S")])[0]) // step * step
+            hi = min(int(label_to_ts([end or "9999-12-31 23:59:59"])[0]), now_bucket - 1)
+            # Buckets are labelled by their start, which must fall inside the range (as in SQL)
+            lo = -(-int(label_to_ts([start])[0]) // step) * step
+            ts, _, values = ring.select(lo, hi)
+        if not ts.size:
+            return []
+        buckets, inverse = np.unique(ts // step, return_inverse=True)
+        columns = {}
+        for i, m in enumerate(HOT_METRICS):
+            col = values[:, i]
+            ok = ~np.isnan(col)
+            sums = np.bincount(inverse[ok], weights=col[ok], minlength=len(buckets))
+            n = np.bincount(inverse[ok], minlength=len(buckets))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                columns[m] = sums / n
+        return _rows(ts_to_labels(buckets * step), columns, device_id)
+
+    def latest(self, conn, device_id: int):
+        """Newest sample as a dict, or None."""
+        ring = self.sync(conn, device_id)
+        with self.lock:
+            if ring is None or not ring.size:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            order = ring._order()
+            pos = order[np.lexsort((ring.ids[order], ring.ts[order]))[-1]]
+            ts, row_id, values = ring.ts[pos:pos + 1], int(ring.ids[pos]), ring.values[pos:pos + 1]
+        return _rows(ts_to_labels(ts), {m: values[:, i] for i, m in enumerate(HOT_METRICS)}, device_id, [row_id])[0]
+
+    def live_stats(self, conn, device_id: int, seconds: int):
+        """Count, min, max, mean, std and last value per metric over the last 'seconds'."""
+        ring = self.sync(conn, device_id)
+        with self.lock:
+            if ring is None or not ring.size:
+                return None
+            hi = int(label_to_ts([datetime.now().strftime("%Y-%m-%d %H:%M:%S")])[0])
+            ts, _, values = ring.select(hi - seconds, hi)
+        out = {"device_id": device_id, "seconds": seconds, "count": int(ts.size)}
+        for i, m in enumerate(HOT_METRICS):
+            col = values[:, i]
+            col = col[~np.isnan(col)]
+            out[m] = None if not col.size else {
+                "min": float(col.min()), "max": float(col.max()), "mean": round(float(col.mean()), 3),
+                "std": round(float(col.std()), 3), "last": float(col[-1]),
+            }
+        return out
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters, devices=len(self.rings), bytes=self._total_bytes(), max_bytes=self.max_bytes,
+                        rows=sum(r.size for r in self.rings.values()))
+
+def _rows(labels: list, columns: dict, device_id: int, ids: list = None) -> list:
+    """Column arrays -> JSON-ready row dicts (NaN becomes null)."""
+    lists = {m: [None if v != v else v for v in columns[m].tolist()] for m in HOT_METRICS}
+    rows = []
+    for i, label in enumerate(labels):
+        row = {"date_time": label, "device_id": device_id}
+        if ids is not None:
+            row["id"] = ids[i]
+        for m in HOT_METRICS:
+            row[m] = lists[m][i]
+        rows.append(row)
+    return rows
+
+hot_window = HotWindow()
+
+# --- Tier Selection ---
+
+def select_tier(start: str, end: str, points: int = DEFAULT_POINT_BUDGET) -> str:
+    """
+    Picks the finest tier whose point count over [start, end] fits 'points'.
+
+    Logic:
+    1. Resolution: A tier qualifies when span / tier resolution <= points.
+    2. Coverage: The minute tier only holds MINUTE_RETENTION_DAYS; older
+       starts fall through to hourly (raw, hourly and daily are complete
+       thanks to the archive).
+    """
+    span = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+    minute_floor = (datetime.now() - timedelta(days=MINUTE_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    for tier, (_, resolution) in TIERS.items():
+        if span / resolution > points:
+            continue
+        if tier == "minute" and start < minute_floor:
+            continue
+        return tier
+    return "daily"
+
+def _delete_in_steps(conn: sqlite3.Connection, table: str, where: str, params: tuple, deadline: float = None) -> bool:
+    """
+    Deletes matching rows PRUNE_BATCH_ROWS at a time, committing each batch.
+    Returns False if the monotonic 'deadline' stopped it before the end.
+    """
+    while True:
+        cur = conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+            (*params, PRUNE_BATCH_ROWS)
+        )
+        conn.commit()
+        if cur.rowcount < PRUNE_BATCH_ROWS:
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+
+def prune_raw(conn: sqlite3.Connection, deadline: float = None) -> dict:
     """
-    Enforces data retention policies via age-based deletion.
+    Enforces data retention policies.
     
     Logic:
-    1. live_data: Deletes raw rows older than 48 hours to save space.
-    2. Hourly: Deletes summarized hours older than 90 days.
-    3. Sequence: This must run AFTER aggregation to ensure data is summarized 
-       before it is purged.
+    1. live_data: Drops whole day partitions once every row in them is older
+       than RAW_RETENTION_HOURS (O(1) per partition, no B-tree churn).
+    2. Minute/Hourly: Deletes summarized minutes older than MINUTE_RETENTION_DAYS
+       and hours older than HOURLY_RETENTION_DAYS.
+    3. GPS: Fixes follow the raw retention (RAW_RETENTION_HOURS).
+    4. Archive: With ARCHIVE_ENABLED, expiring raw partitions and hourly rows
+       are first packed into compressed monthly segments (archive_services),
+       so nothing is lost; /api/history reads them back transparently.
+    5. Sequence: This must run AFTER aggregation to ensure data is summarized 
+       before it is purged; partitions the hourly rollup has not reached
+       are kept.
+    6. Budget: Work happens in steps that each commit (one partition, one
+       day of hourly rows, PRUNE_BATCH_ROWS deletes). Once the monotonic
+       'deadline' passes the run stops and reports 'more'.
     """
-    conn.execute("DELETE FROM live_data WHERE date_time < datetime('now', '-48 hours')")
-    conn.execute("DELETE FROM hourly_history WHERE time_label < datetime('now', '-90 days')")
-    conn.commit()
+    steps = 0
+
+    def out_of_time():
+        # The first step always runs, so a short budget still makes progress
+        return steps > 0 and deadline is not None and time.monotonic() >= deadline
+
+    now = datetime.now()
+    raw_cutoff = hours_back(now, RAW_RETENTION_HOURS)
+    rolled = conn.execute("SELECT MAX(time_label) FROM hourly_history").fetchone()[0]
+    raw_cutoff = min(raw_cutoff, datetime.fromisoformat(rolled).date() if rolled else date.min)
+    more, dropped = False, 0
+    for name in list_partitions(conn):
+        day = partition_day(name)
+        if day >= raw_cutoff:
+            break
+        if out_of_time():
+            more = True
+            break
+        if ARCHIVE_ENABLED:
+            archive_partition(conn, name)
+        # Oldest first, so this drops exactly one partition
+        dropped += len(drop_partitions_before(conn, day + timedelta(days=1)))
+        steps += 1
 
-def maybe_vacuum(conn: sqlite3.Connection):
+    more = more or not _delete_in_steps(conn, "gps_data", "date_time < ?",
+                                        (f"{raw_cutoff:%Y-%m-%d} 00:00:00",), deadline)
+
+    minute_cutoff = (now - timedelta(days=MINUTE_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:00")
+    if not more:
+        more = not _delete_in_steps(conn, "minute_history", "time_label < ?", (minute_cutoff,), deadline)
+
+    hourly_cutoff = (now - timedelta(days=HOURLY_RETENTION_DAYS)).strftime("%Y-%m-%d %H:00:00")
+    while not more:
+        oldest = conn.execute("SELECT MIN(time_label) FROM hourly_history").fetchone()[0]
+        if not oldest or oldest >= hourly_cutoff:
+            break
+        if out_of_time():
+            more = True
+            break
+        # One day per step: archive it, then delete it
+        step_end = min(f"{datetime.fromisoformat(oldest).date() + timedelta(days=1)} 00:00:00", hourly_cutoff)
+        if ARCHIVE_ENABLED:
+            archive_hourly_before(conn, step_end)
+        _delete_in_steps(conn, "hourly_history", "time_label < ?", (step_end,))
+        steps += 1
+    return {"partitions_dropped": dropped, "more": more}
+
+def maybe_vacuum(conn: sqlite3.Connection) -> bool:
     """
     Rebuilds the database file to reclaim unused space and defragment the schema.
+    Returns False if the VACUUM failed (e.g. the database was busy).
     
     Note: Requires autocommit mode (isolation_level = None) because VACUUM 
     cannot run inside an active transaction.
@@ -74,26 +777,84 @@ def maybe_vacuum(conn: sqlite3.Connection):
     try:
         conn.isolation_level = None
         conn.execute("VACUUM")
+        return True
     except sqlite3.OperationalError as e:
         print(f"Vacuum failed: {e}")
+        return False
     finally:
         conn.isolation_level = ""
 
+def ensure_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """
+    Migrates the database to auto_vacuum=INCREMENTAL.
+
+    Note: The mode of an existing file only changes after one full VACUUM, so
+    this pays that cost once. Returns True if a migration was performed; a
+    failed VACUUM leaves the mode unchanged and returns False.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if not maybe_vacuum(conn):
+        return False
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
 
-def aggregate_hours(conn: sqlite3.Connection):
+def incremental_vacuum(conn: sqlite3.Connection, step_pages: int, deadline: float) -> int:
     """
-    Summarizes raw 'live_data' into 1-hour windows stored in 'hourly_history'.
+    Returns free pages to the OS in small steps until the freelist is empty
+    or the monotonic 'deadline' is reached. Each step is its own short write,
+    so ingest only ever waits for one step. Returns the number of pages freed,
+    measured on the freelist (a database not in incremental mode frees none).
+    """
+    start = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free and time.monotonic() < deadline:
+        conn.execute(f"PRAGMA incremental_vacuum({min(step_pages, free)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if after >= free:
+            # Nothing was released (auto_vacuum is not INCREMENTAL): stop instead of spinning
+            break
+        free = after
+    return start - free
+
+def checkpoint_wal(conn: sqlite3.Connection, mode: str = "PASSIVE") -> dict:
+    """Runs a WAL checkpoint; mode is one of PASSIVE, FULL, RESTART, TRUNCATE."""
+    busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return {"mode": mode, "busy": bool(busy), "log_frames": log_frames, "checkpointed": checkpointed}
+
+
+def _rollup_raw(conn: sqlite3.Connection, table: str, bucket_fmt: str, until: str,
+                step: timedelta, deadline: float = None) -> bool:
+    """
+    Summarizes raw 'live_data' into fixed windows stored in 'table'.
     
     Logic:
-    1. Grouping: Uses strftime to truncate 'date_time' to the start of its hour.
-    2. Boundaries: Only processes data where the hour has fully concluded 
-       (date_time < current hour) to avoid summarizing incomplete buckets.
-    3. Idempotency: Uses UPSERT (ON CONFLICT DO UPDATE). If new data arrives 
-       for an hour already summarized, it recalculates and overwrites the 
-       existing row, ensuring total accuracy for late-arriving packets.
+    1. Grouping: Uses strftime('bucket_fmt') to truncate 'date_time' to the start of its window.
+    2. Boundaries: Only processes data where the window has fully concluded 
+       (date_time < until) to avoid summarizing incomplete buckets.
+    3. Idempotency: Uses UPSERT (ON CONFLICT DO UPDATE). Each run starts
+       INGEST_MAX_AGE_SECONDS before the newest summarized window, the oldest
+       reading time ingest still accepts, so windows that late packets can
+       reach are recalculated and overwritten. Older windows are final.
+    4. Routing: Only the raw partitions between that start and 'until' are read.
+    5. Budget: The range is summarized 'step' at a time (a multiple of the
+       bucket), each step its own transaction. Once the monotonic 'deadline'
+       passes it stops and returns False; the next run continues from there.
     """
-    sql = """
-        INSERT INTO hourly_history (
+    since = conn.execute(
+        f"SELECT strftime(?, MAX(time_label), ?) FROM {table}",
+        (bucket_fmt, f"-{INGEST_MAX_AGE_SECONDS} seconds")
+    ).fetchone()[0]
+    if since is None:
+        partitions = list_partitions(conn)
+        if not partitions:
+            return True
+        first = conn.execute(f"SELECT MIN(date_time) FROM {partitions[0]}").fetchone()[0]
+        if first is None:
+            return True
+        since = conn.execute("SELECT strftime(?, ?)", (bucket_fmt, first)).fetchone()[0]
+
+    sql = f"""
+        INSERT INTO {table} (
             time_label, device_id, 
             temp_min, temp_max, temp_avg,
             hum_min, hum_max, hum_avg,
@@ -103,7 +864,7 @@ def aggregate_hours(conn: sqlite3.Connection):
             sample_count
         )
         SELECT 
-            strftime('%Y-%m-%d %H:00:00', date_time) as hour_bucket,
+            strftime('{bucket_fmt}', date_time) as bucket,
             device_id,
             MIN(temp), MAX(temp), AVG(temp),
             MIN(hum), MAX(hum), AVG(hum),
@@ -111,9 +872,9 @@ def aggregate_hours(conn: sqlite3.Connection):
             MIN(gas_pct), MAX(gas_pct), AVG(gas_pct),
             MIN(press), MAX(press), AVG(press),
             COUNT(*)
-        FROM live_data
-        WHERE date_time < strftime('%Y-%m-%d %H:00:00', 'now')
-        GROUP BY hour_bucket, device_id
+        FROM {{source}}
+        WHERE date_time >= ? AND date_time < ?
+        GROUP BY bucket, device_id
         ON CONFLICT(time_label, device_id) DO UPDATE SET
             temp_min = excluded.temp_min, temp_max = excluded.temp_max, temp_avg = excluded.temp_avg,
             hum_min = excluded.hum_min, hum_max = excluded.hum_max, hum_avg = excluded.hum_avg,
@@ -122,8 +883,42 @@ def aggregate_hours(conn: sqlite3.Connection):
             press_min = excluded.press_min, press_max = excluded.press_max, press_avg = excluded.press_avg,
             sample_count = excluded.sample_count;
     """
-    conn.execute(sql)
-    conn.commit()
+    lo = datetime.fromisoformat(since)
+    end = datetime.fromisoformat(until)
+    while lo < end:
+        hi = min(lo + step, end)
+        # 'hi' is exclusive: a step ending at midnight does not touch the next day
+        partitions = partitions_for_range(conn, lo, hi - timedelta(seconds=1))
+        if not partitions:
+            # No raw day in this step (a gap): skip it without spending the budget
+            lo = hi
+            continue
+        cur = conn.execute(sql.format(source=union_source(partitions)),
+                           (lo.strftime("%Y-%m-%d %H:%M:%S"), hi.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+        lo = hi
+        # Checked after a step that wrote rows, so every run makes progress
+        if cur.rowcount and lo < end and deadline is not None and time.monotonic() >= deadline:
+            return False
+    return True
+
+def aggregate_minutes(conn: sqlite3.Connection, deadline: float = None) -> bool:
+    """
+    Summarizes raw data into 1-minute windows stored in 'minute_history'.
+    Runs every minute; each run only touches the minutes late packets can still reach.
+    Returns False if the deadline cut it short.
+    """
+    done = _rollup_raw(conn, "minute_history", "%Y-%m-%d %H:%M:00", datetime.now().strftime('%Y-%m-%d %H:%M:00'),
+                       timedelta(hours=1), deadline)
+    query_cache.bump("minute")
+    return done
+
+def aggregate_hours(conn: sqlite3.Connection, deadline: float = None) -> bool:
+    """Summarizes raw data into 1-hour windows stored in 'hourly_history'. False if cut short."""
+    done = _rollup_raw(conn, "hourly_history", "%Y-%m-%d %H:00:00", datetime.now().strftime('%Y-%m-%d %H:00:00'),
+                       timedelta(days=1), deadline)
+    query_cache.bump("hourly")
+    return done
 
 def aggregate_days(conn: sqlite3.Connection):
     """
@@ -134,7 +929,11 @@ def aggregate_days(conn: sqlite3.Connection):
     2. Boundaries: Only summarizes days that have ended (time_label < today's date).
     3. Self-Correction: Uses UPSERT to recalculate daily totals if the underlying 
        hourly records were updated or added after the last daily run.
+    4. Range: Starts at the newest stored day (recomputed), so a run reads
+       about a day of hourly rows instead of the whole table; older days
+       are rebuilt with db_repair.py.
     """
+    since = conn.execute("SELECT MAX(time_label) FROM daily_history").fetchone()[0]
     sql = """
         INSERT INTO daily_history (
             time_label, device_id,
@@ -155,7 +954,7 @@ def aggregate_days(conn: sqlite3.Connection):
             MIN(press_min), MAX(press_max), AVG(press_avg),
             SUM(sample_count)
         FROM hourly_history
-        WHERE time_label < date('now')
+        WHERE time_label >= ? AND time_label < date('now')
         GROUP BY day_label, device_id
         ON CONFLICT(time_label, device_id) DO UPDATE SET
             temp_min = excluded.temp_min, temp_max = excluded.temp_max, temp_avg = excluded.temp_avg,
@@ -165,8 +964,9 @@ def aggregate_days(conn: sqlite3.Connection):
             press_min = excluded.press_min, press_max = excluded.press_max, press_avg = excluded.press_avg,
             sample_count = excluded.sample_count;
     """
-    conn.execute(sql)
+    conn.execute(sql, (since or '',))
     conn.commit()
+    query_cache.bump("daily")
 
 # Ensure database layout
 
@@ -179,19 +979,8 @@ def ensure_schema():
         with open_db() as conn:
             cur = conn.cursor()
 
-            # 1. Raw Measurements Table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS live_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date_time TEXT,
-                    temp REAL,
-                    hum REAL,
-                    lux REAL,
-                    gas_pct REAL,
-                    press REAL,
-                    device_id INTEGER NOT NULL
-                )
-            """)
+            # 1. Raw Measurements (day partitions behind the 'live_data' view)
+            ensure_raw_schema(conn)
 
             # Definition for history tables
             history_columns = """
@@ -207,12 +996,21 @@ def ensure_schema():
             """
 
             # 2. History Tables
+            cur.execute(f"CREATE TABLE IF NOT EXISTS minute_history ({history_columns})")
             cur.execute(f"CREATE TABLE IF NOT EXISTS hourly_history ({history_columns})")
             cur.execute(f"CREATE TABLE IF NOT EXISTS daily_history ({history_columns})")
 
             # 3. Performance Indexes
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_live_data_dt ON live_data(date_time)")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_hourly_dt ON hourly_history(time_label)")
+
+            # 4. Detection events
+            ensure_events_table(conn)
+
+            # 5. GPS fixes
+            ensure_gps_schema(conn)
+
+            # 6. Ingest sequence tracking (dedup high-water marks)
+            ensure_seq_table(conn)
             
             conn.commit()
             return True
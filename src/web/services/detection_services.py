@@ -0,0 +1,354 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from shared.config import (
+    DETECTION_RULES, DETECTION_EWMA_ALPHA, DETECTION_WARMUP_SAMPLES, DETECTION_HISTORY_SECONDS,
+    INGEST_MAX_AGE_SECONDS
+)
+from shared.raw_store import partitions_for_range, union_source
+
+# --- Streaming anomaly detection on ingest ---
+#
+# Every sample updates a small, fixed amount of state per (device, metric):
+# EWMA mean/variance, the last value and time, a repeat counter and
+# monotonic deques for the rolling min/max. Rules are evaluated against that
+# state and only emit an event on a rising edge, so detection does at most
+# a couple of small writes when a condition starts or ends.
+
+METRICS = ("temp", "hum", "lux", "gas_pct", "press")
+ROLLING_WINDOW = 300
+
+class MetricState:
+    __slots__ = ("count", "mean", "var", "last", "last_t", "repeats", "mins", "maxs", "seq")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last = None
+        self.last_t = None
+        self.repeats = 0
+        self.mins = deque()
+        self.maxs = deque()
+        self.seq = 0
+
+    def update(self, value: float, t: float, alpha: float):
+        """O(1) amortized: EWMA, repeat counter and rolling min/max."""
+        self.repeats = self.repeats + 1 if value == self.last else 0
+        self.last_t, self.last = t, value
+
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            incr = alpha * diff
+            self.mean += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.count += 1
+
+        self.seq += 1
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((self.seq, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((self.seq, value))
+        floor = self.seq - ROLLING_WINDOW
+        if self.mins[0][0] <= floor:
+            self.mins.popleft()
+        if self.maxs[0][0] <= floor:
+            self.maxs.popleft()
+
+    def zscore(self, value: float):
+        if self.count < DETECTION_WARMUP_SAMPLES or self.var <= 0:
+            return None
+        return (value - self.mean) / math.sqrt(self.var)
+
+    def to_dict(self) -> dict:
+        return {
+            "ewma": round(self.mean, 3),
+            "std": round(math.sqrt(self.var), 3),
+            "last": self.last,
+            "min": self.mins[0][1] if self.mins else None,
+            "max": self.maxs[0][1] if self.maxs else None,
+            "repeats": self.repeats,
+            "samples": self.count,
+        }
+
+class Detector:
+    """
+    Evaluates DETECTION_RULES on every stored sample.
+
+    Logic:
+    1. Input: catch_up() feeds committed rows of a device that this process
+       has not seen yet, in id order, whichever worker stored them. Every
+       process therefore evaluates the full stream of a device, and a
+       rolled back ingest never reaches the detector.
+    2. State: One MetricState per (device, metric), created lazily. The
+       first catch_up() of a device replays DETECTION_HISTORY_SECONDS of
+       stored rows to build the baselines; edges already applied by other
+       processes are not applied again (see 3).
+    3. Edges: A rule fires once when its condition becomes true and re-arms
+       once it is false again. The open/closed state lives in 'event_edges'
+       (one row per device and rule), and a transition is only applied if
+       no other process already applied it for the same or a later sample,
+       so every worker may evaluate a sample but only one event is written.
+    4. Dropout: check_dropouts() is run periodically by the maintenance
+       leader (not per sample) from the newest stored sample per device.
+    """
+    def __init__(self, rules=None, alpha=DETECTION_EWMA_ALPHA):
+        self.rules = rules if rules is not None else DETECTION_RULES
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.states = {}
+        self.active = set()   # Local mirror of the open rows in event_edges
+        self.seen = {}        # device_id -> highest row id fed
+
+    def _evaluate(self, rule: dict, state: MetricState, value: float, prev, prev_t, t: float, z):
+        kind = rule["kind"]
+        if kind == "threshold":
+            if "above" in rule and value > rule["above"]:
+                return f"{value} > {rule['above']}"
+            if "below" in rule and value < rule["below"]:
+                return f"{value} < {rule['below']}"
+        elif kind == "rate":
+            if prev is not None:
+                # Stored labels have 1 s resolution; bursts must not inflate the rate
+                rate = abs(value - prev) / max(t - prev_t, 1.0)
+                if rate > rule["limit"]:
+                    return f"rate {rate:.3f}/s > {rule['limit']}/s"
+        elif kind == "zscore":
+            if z is not None and abs(z) > rule["limit"]:
+                return f"z={z:.2f} (ewma {state.mean:.3f})"
+        elif kind == "stuck":
+            if state.repeats >= rule["limit"]:
+                return f"{state.repeats} identical readings"
+        elif kind == "spread":
+            spread = state.maxs[0][1] - state.mins[0][1]
+            if spread > rule["limit"]:
+                return f"rolling spread {spread:.3f} > {rule['limit']}"
+        return None
+
+    def _edge(self, conn: sqlite3.Connection, device_id: int, rule: dict, firing: bool, as_of: int, label: str) -> bool:
+        """
+        Applies a rising or falling edge to 'event_edges'. Returns True if
+        this call opened the condition (the caller then writes the event).
+        """
+        key = (device_id, rule["name"])
+        if firing == (key in self.active):
+            return False
+        if firing:
+            self.active.add(key)
+        else:
+            self.active.discard(key)
+        conn.execute("INSERT OR IGNORE INTO event_edges (device_id, rule) VALUES (?, ?)", key)
+        cur = conn.execute("""
+            UPDATE event_edges SET active = ?, as_of = ?, changed = ?
+            WHERE device_id = ? AND rule = ? AND active = ? AND as_of < ?
+        """, (int(firing), as_of, label, *key, int(not firing), as_of))
+        return firing and cur.rowcount == 1
+
+    def _observe(self, conn, device_id: int, sample: dict, t: float, label: str, as_of: int) -> list:
+        events = []
+        for metric in METRICS:
+            value = sample.get(metric)
+            if value is None:
+                continue
+            value = float(value)
+            state = self.states.get((device_id, metric))
+            if state is None:
+                state = self.states[(device_id, metric)] = MetricState()
+            prev, prev_t = state.last, state.last_t
+            # The z-score is taken against the baseline before this sample
+            z = state.zscore(value)
+            state.update(value, t, self.alpha)
+            for rule in self.rules:
+                if rule["metric"] != metric:
+                    continue
+                reason = self._evaluate(rule, state, value, prev, prev_t, t, z)
+                if self._edge(conn, device_id, rule, reason is not None, as_of, label):
+                    events.append(self._event(label, device_id, rule, value, reason))
+        return events
+
+    def catch_up(self, conn: sqlite3.Connection, device_id: int, now: datetime = None) -> list:
+        """
+        Feeds the device's committed rows this process has not seen yet;
+        returns new event dicts (usually none). The caller stores them and commits.
+        """
+        now = now or datetime.now()
+        with self.lock:
+            seen = self.seen.get(device_id)
+            if seen is None:
+                # First sight: rebuild the baselines from recent history
+                since = now - timedelta(seconds=DETECTION_HISTORY_SECONDS)
+                source = union_source(partitions_for_range(conn, since, None))
+                where, params = "device_id = ? AND date_time >= ?", (device_id, since.strftime("%Y-%m-%d %H:%M:%S"))
+                # Start from the conditions other processes already hold open
+                self.active = {key for key in self.active if key[0] != device_id}
+                self.active |= {(device_id, r[0]) for r in conn.execute(
+                    "SELECT rule FROM event_edges WHERE device_id = ? AND active = 1", (device_id,))}
+            else:
+                # Newer rows are at most INGEST_MAX_AGE_SECONDS old; '+device_id'
+                # keeps the scan on the id range instead of the device index
+                source = union_source(partitions_for_range(conn, now - timedelta(seconds=INGEST_MAX_AGE_SECONDS), None))
+                where, params = "id > ? AND +device_id = ?", (seen, device_id)
+            rows = conn.execute(f"""
+                SELECT id, date_time, temp, hum, lux, gas_pct, press FROM {source}
+                WHERE {where} ORDER BY id
+            """, params).fetchall()
+
+            events = []
+            for row in rows:
+                sample = {metric: row[metric] for metric in METRICS}
+                t = datetime.fromisoformat(row["date_time"]).timestamp()
+                events.extend(self._observe(conn, device_id, sample, t, row["date_time"], row["id"]))
+            if rows:
+                self.seen[device_id] = rows[-1]["id"]
+            elif seen is None:
+                self.seen[device_id] = 0
+        return events
+
+    def forget(self, device_ids):
+        """Drops local state after a failed detection transaction; the next catch_up() rebuilds it."""
+        with self.lock:
+            for device_id in device_ids:
+                self.seen.pop(device_id, None)
+                for metric in METRICS:
+                    self.states.pop((device_id, metric), None)
+
+    def check_dropouts(self, conn: sqlite3.Connection, last_seen: dict, now: datetime = None) -> list:
+        """'last_seen' maps device_id -> newest sample label. The caller stores and commits."""
+        now = now or datetime.now()
+        label = now.strftime("%Y-%m-%d %H:%M:%S")
+        events = []
+        with self.lock:
+            for rule in self.rules:
+                if rule["kind"] != "dropout":
+                    continue
+                for device_id, seen in last_seen.items():
+                    silent = (now - datetime.fromisoformat(seen)).total_seconds()
+                    # Only the leader evaluates dropouts: the clock orders its edges
+                    if self._edge(conn, device_id, rule, silent > rule["limit"], int(now.timestamp()), label):
+                        events.append(self._event(label, device_id, rule, None, f"silent for {silent:.0f}s"))
+        return events
+
+    def _event(self, label, device_id, rule, value, reason) -> dict:
+        return {"date_time": label, "device_id": device_id, "rule": rule["name"], "metric": rule["metric"],
+                "kind": rule["kind"], "severity": rule.get("severity", "info"), "value": value, "detail": reason}
+
+    def snapshot(self, device_id: int) -> dict:
+        with self.lock:
+            return {metric: state.to_dict() for (dev, metric), state in self.states.items() if dev == device_id}
+
+detector = Detector()
+
+# --- Persistence ---
+
+def ensure_events_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_time TEXT NOT NULL,
+            device_id INTEGER NOT NULL,
+            rule TEXT NOT NULL,
+            metric TEXT,
+            kind TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            value REAL,
+            detail TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_dev_dt ON events(device_id, date_time)")
+    # One row per (device, rule): at most one open condition, and 'as_of'
+    # (sample id, or clock for dropouts) orders transitions across processes
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS event_edges (
+            device_id INTEGER NOT NULL,
+            rule TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 0,
+            as_of INTEGER NOT NULL DEFAULT -1,
+            changed TEXT,
+            PRIMARY KEY (device_id, rule)
+        )
+    """)
+
+def store_events(conn: sqlite3.Connection, events: list):
+    """Inserts events; the caller commits (ingest shares its transaction)."""
+    if events:
+        conn.executemany("""
+            INSERT INTO events (date_time, device_id, rule, metric, kind, severity, value, detail)
+            VALUES (:date_time, :device_id, :rule, :metric, :kind, :severity, :value, :detail)
+        """, events)
+
+def detect_stored(conn: sqlite3.Connection, device_ids) -> list:
+    """
+    Runs detection over newly committed rows of the given devices, in a
+    short transaction of its own. A failure here never fails the ingest
+    (the rows are already stored); the next call picks the rows up again.
+    """
+    device_ids = sorted(set(device_ids))
+    try:
+        events = []
+        for device_id in device_ids:
+            events.extend(detector.catch_up(conn, device_id))
+        store_events(conn, events)
+        conn.commit()
+        return events
+    except sqlite3.Error as e:
+        conn.rollback()
+        detector.forget(device_ids)
+        print(f"Detection failed: {e}")
+        return []
+
+def last_seen_by_device(conn: sqlite3.Connection, now: datetime = None) -> dict:
+    """
+    Newest sample label per device over the last day.
+
+    Logic:
+    1. Partitions: Only today's and yesterday's, newest first; a device
+       found in a newer partition is not looked up again.
+    2. Index seeks: Devices are enumerated with MIN(device_id) > ? and their
+       newest sample read with MAX(date_time), both answered by the
+       (device_id, date_time) index. Cost grows with the device count, not
+       the row count, and every statement is short (no long read snapshot).
+    """
+    now = now or datetime.now()
+    since = (now - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    seen = {}
+    for name in reversed(partitions_for_range(conn, now - timedelta(days=1), now)):
+        device_id = conn.execute(f"SELECT MIN(device_id) FROM {name}").fetchone()[0]
+        while device_id is not None:
+            if device_id not in seen:
+                newest = conn.execute(
+                    f"SELECT MAX(date_time) FROM {name} WHERE device_id = ? AND date_time >= ?",
+                    (device_id, since)
+                ).fetchone()[0]
+                if newest is not None:
+                    seen[device_id] = newest
+            device_id = conn.execute(
+                f"SELECT MIN(device_id) FROM {name} WHERE device_id > ?", (device_id,)
+            ).fetchone()[0]
+    return seen
+
+def query_events(conn: sqlite3.Connection, device_id=None, since_id: int = 0, start=None, end=None,
+                 severity=None, limit: int = 500) -> list:
+    where, args = ["id > ?"], [since_id]
+    if device_id is not None:
+        where.append("device_id = ?")
+        args.append(device_id)
+    if start:
+        where.append("date_time >= ?")
+        args.append(start)
+    if end:
+        where.append("date_time <= ?")
+        args.append(end)
+    if severity:
+        where.append("severity = ?")
+        args.append(severity)
+    rows = conn.execute(
+        f"SELECT * FROM events WHERE {' AND '.join(where)} ORDER BY id ASC LIMIT ?", (*args, limit)
+    ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import struct
+import zlib
+from array import array
+from datetime import datetime
+from services.data_services import open_db_readonly, read_chunked, partitions_for_range
+
+# --- Streaming bulk export ---
+#
+# Every format is produced chunk by chunk from read_chunked(), so memory use
+# stays constant regardless of the exported range.
+
+RAW_FIELDS = ["id", "date_time", "device_id", "temp", "hum", "lux", "gas_pct", "press"]
+HISTORY_FIELDS = [
+    "time_label", "device_id",
+    "temp_min", "temp_max", "temp_avg",
+    "hum_min", "hum_max", "hum_avg",
+    "lux_min", "lux_max", "lux_avg",
+    "gas_min", "gas_max", "gas_avg",
+    "press_min", "press_max", "press_avg",
+    "sample_count",
+]
+
+TIERS = {
+    # tier: (fields, time column, keyset columns)
+    "raw": (RAW_FIELDS, "date_time", ("date_time", "id")),
+    "hourly": (HISTORY_FIELDS, "time_label", ("time_label", "device_id")),
+    "daily": (HISTORY_FIELDS, "time_label", ("time_label", "device_id")),
+}
+
+COLUMNAR_MAGIC = b"GSCOL1\n"
+
+def iter_export_rows(tier: str, devices: list, start: str, end: str):
+    """
+    Yields row chunks for the export on a read-only connection.
+
+    Raw exports read one day partition at a time, oldest first. Partitions
+    split by day, so that is already (date_time, id) order, and each chunk
+    is an index range scan instead of a sort over every partition.
+    """
+    fields, time_col, keys = TIERS[tier]
+    conn = open_db_readonly()
+    try:
+        if tier == "raw":
+            sources = partitions_for_range(conn, start, end)
+        else:
+            sources = [f"{tier}_history"]
+
+        where, params = [], []
+        if devices:
+            # Several devices: the '+' keeps the planner on the date_time
+            # index, which is already in key order (no per-chunk sort)
+            column = "+device_id" if tier == "raw" and len(devices) > 1 else "device_id"
+            where.append(f"{column} IN ({','.join('?' * len(devices))})")
+            params.extend(devices)
+        if start:
+            where.append(f"{time_col} >= ?")
+            params.append(start)
+        if end:
+            where.append(f"{time_col} <= ?")
+            params.append(end)
+
+        for source in sources:
+            yield from read_chunked(conn, source, ", ".join(fields), " AND ".join(where) or "1", tuple(params), keys)
+    finally:
+        conn.close()
+
+def csv_stream(tier: str, chunks):
+    fields = TIERS[tier][0]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for rows in chunks:
+        writer.writerows(tuple(row) for row in rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def ndjson_stream(tier: str, chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(dict(row)) + "\n" for row in rows).encode("utf-8")
+
+def columnar_stream(tier: str, chunks):
+    """
+    Compact columnar file: one zlib-compressed row group per chunk.
+
+    Layout: MAGIC, then per row group a little-endian uint32 byte length and
+    the compressed payload. A payload is a JSON header line
+    {"rows": n, "columns": [[name, typecode], ...]} followed by each column
+    packed as an array of that typecode. Timestamps are int64 epoch seconds
+    ('q'), device ids and counts are int64 ('q'), measurements are float64
+    ('d', NaN for NULL).
+    """
+    fields, time_col, _ = TIERS[tier]
+    int_cols = {"id", "device_id", "sample_count", time_col}
+    yield COLUMNAR_MAGIC
+    for rows in chunks:
+        columns, blobs = [], []
+        for name in fields:
+            if name == time_col:
+                values = array("q", (int(datetime.fromisoformat(r[name]).timestamp()) for r in rows))
+            elif name in int_cols:
+                values = array("q", (r[name] or 0 for r in rows))
+            else:
+                values = array("d", (float("nan") if r[name] is None else r[name] for r in rows))
+            columns.append([name, values.typecode])
+            blobs.append(values.tobytes())
+        header = json.dumps({"rows": len(rows), "columns": columns}).encode("utf-8") + b"\n"
+        payload = zlib.compress(header + b"".join(blobs), 6)
+        yield struct.pack("<I", len(payload)) + payload
+
+def read_columnar(fileobj) -> dict:
+    """Loads a columnar export back into {column: array}. Analysis helper."""
+    if fileobj.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a GreenSat columnar export")
+    out = {}
+    while True:
+        size = fileobj.read(4)
+        if len(size) < 4:
+            break
+        payload = zlib.decompress(fileobj.read(struct.unpack("<I", size)[0]))
+        header_end = payload.index(b"\n")
+        header = json.loads(payload[:header_end])
+        offset = header_end + 1
+        for name, typecode in header["columns"]:
+            values = array(typecode)
+            width = values.itemsize * header["rows"]
+            values.frombytes(payload[offset:offset + width])
+            offset += width
+            out.setdefault(name, array(typecode)).extend(values)
+    return out
+
+def gzip_stream(stream):
+    """Compresses a byte stream on the fly (gzip container)."""
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for block in stream:
+        data = comp.compress(block)
+        if data:
+            yield data
+    yield comp.flush()
+
+FORMATS = {
+    # format: (writer, mimetype, extension)
+    "csv": (csv_stream, "text/csv", "csv"),
+    "ndjson": (ndjson_stream, "application/x-ndjson", "ndjson"),
+    "columnar": (columnar_stream, "application/octet-stream", "gscol"),
+}
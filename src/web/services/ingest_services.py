@@ -0,0 +1,219 @@
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from shared.config import SEQ_MAX_GAP_RANGES
+
+# --- Idempotent ingest: per-device sequence numbers ---
+#
+# Probes (and the bridge) stamp every packet with 'seq', increasing by one
+# per packet, and 'boot', a random id drawn at start-up. The server keeps, per
+# device, the highest seq seen (high-water mark) and the missing seqs below it
+# as a short sorted list of [lo, hi] ranges. A retried packet is then either
+# a gap being filled (accepted) or a duplicate (dropped), decided in
+# O(log ranges) without touching live_data.
+#
+# The state is persisted inside the ingest transaction: counters and the
+# high-water mark in a small 'ingest_seq' row, the gap ranges (packed int64
+# pairs) in 'ingest_seq_gaps', rewritten only when they change. A version
+# column tells a worker whether another process moved the row since its
+# in-memory copy.
+
+STAT_FIELDS = ("received", "duplicates", "late", "missing", "lost", "resets")
+
+class SeqState:
+    __slots__ = ("boot", "hwm", "gaps", "version", *STAT_FIELDS)
+
+    def __init__(self, boot=None, hwm=-1, gaps=None, version=0, **stats):
+        self.boot = boot
+        self.hwm = hwm
+        self.gaps = gaps or []
+        self.version = version
+        for name in STAT_FIELDS:
+            setattr(self, name, stats.get(name, 0))
+
+    def accept(self, seq: int) -> bool:
+        """
+        Returns True for a packet not seen before, False for a duplicate.
+
+        Logic:
+        1. Ahead: seq > hwm opens the gap hwm+1..seq-1 (if any) and moves hwm.
+        2. Behind: seq inside a gap range fills it (late delivery or retry);
+           the range is trimmed or split.
+        3. Otherwise the seq was already stored: duplicate.
+        Past SEQ_MAX_GAP_RANGES ranges, the oldest are given up as lost.
+        """
+        if seq > self.hwm:
+            if seq > self.hwm + 1:
+                self.gaps.append([self.hwm + 1, seq - 1])
+                self.missing += seq - self.hwm - 1
+                while len(self.gaps) > SEQ_MAX_GAP_RANGES:
+                    lo, hi = self.gaps.pop(0)
+                    self.missing -= hi - lo + 1
+                    self.lost += hi - lo + 1
+            self.hwm = seq
+            self.received += 1
+            return True
+
+        i = bisect_right(self.gaps, [seq, float("inf")]) - 1
+        if i >= 0 and self.gaps[i][0] <= seq <= self.gaps[i][1]:
+            lo, hi = self.gaps[i]
+            replacement = [r for r in ([lo, seq - 1], [seq + 1, hi]) if r[0] <= r[1]]
+            self.gaps[i:i + 1] = replacement
+            self.missing -= 1
+            self.late += 1
+            self.received += 1
+            return True
+
+        self.duplicates += 1
+        return False
+
+    def restart(self, boot: int):
+        """A new boot id: the probe's counter started over."""
+        if self.boot is not None:
+            self.resets += 1
+            # Whatever was still missing from the previous run will never come
+            self.lost += self.missing
+            self.missing = 0
+        self.boot = boot
+        self.hwm = -1
+        self.gaps = []
+
+    def to_dict(self) -> dict:
+        out = {"boot": self.boot, "hwm": self.hwm, "gap_ranges": len(self.gaps)}
+        out.update({name: getattr(self, name) for name in STAT_FIELDS})
+        total = self.received + self.missing + self.lost
+        out["loss_pct"] = round(100.0 * (self.missing + self.lost) / total, 3) if total else 0.0
+        return out
+
+def pack_gaps(gaps: list) -> bytes:
+    return array("q", [v for r in gaps for v in r]).tobytes()
+
+def unpack_gaps(blob) -> list:
+    values = array("q")
+    if blob:
+        values.frombytes(blob)
+    return [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+
+def ensure_seq_table(conn: sqlite3.Connection):
+    """
+    'ingest_seq' holds the small per-device row rewritten on every packet;
+    the gap list lives in 'ingest_seq_gaps' and is written only when it changes.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS ingest_seq (
+            device_id INTEGER PRIMARY KEY,
+            boot INTEGER,
+            hwm INTEGER NOT NULL,
+            {', '.join(f'{name} INTEGER NOT NULL DEFAULT 0' for name in STAT_FIELDS)},
+            version INTEGER NOT NULL,
+            updated TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_seq_gaps (
+            device_id INTEGER PRIMARY KEY,
+            gaps BLOB
+        )
+    """)
+
+SEQ_SELECT = f"""
+    SELECT s.device_id, s.boot, s.hwm, g.gaps, {', '.join(f's.{name}' for name in STAT_FIELDS)}, s.version, s.updated
+    FROM ingest_seq s LEFT JOIN ingest_seq_gaps g ON g.device_id = s.device_id
+"""
+
+def _state_from_row(row) -> SeqState:
+    return SeqState(row["boot"], row["hwm"], unpack_gaps(row["gaps"]), row["version"],
+                    **{name: row[name] for name in STAT_FIELDS})
+
+class SequenceTracker:
+    """In-memory SeqStates, kept coherent with 'ingest_seq' across worker processes."""
+    def __init__(self):
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def _load(self, conn: sqlite3.Connection, device_id: int) -> SeqState:
+        row = conn.execute(f"{SEQ_SELECT} WHERE s.device_id = ?", (device_id,)).fetchone()
+        return SeqState() if row is None else _state_from_row(row)
+
+    def _write(self, conn: sqlite3.Connection, device_id: int, state: SeqState, gaps_changed: bool) -> bool:
+        """
+        Stores the state if the row is still at the version it was read at.
+        Returns False when another worker got there first.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        stats = tuple(getattr(state, name) for name in STAT_FIELDS)
+        if state.version == 0:
+            try:
+                conn.execute(f"""
+                    INSERT INTO ingest_seq (device_id, boot, hwm, {', '.join(STAT_FIELDS)}, version, updated)
+                    VALUES (?, ?, ?, {', '.join('?' * len(STAT_FIELDS))}, 1, ?)
+                """, (device_id, state.boot, state.hwm, *stats, now))
+            except sqlite3.IntegrityError:
+                return False
+        else:
+            cur = conn.execute(f"""
+                UPDATE ingest_seq SET boot = ?, hwm = ?, {', '.join(f'{name} = ?' for name in STAT_FIELDS)},
+                    version = version + 1, updated = ?
+                WHERE device_id = ? AND version = ?
+            """, (state.boot, state.hwm, *stats, now, device_id, state.version))
+            if cur.rowcount == 0:
+                return False
+        if gaps_changed:
+            conn.execute("INSERT OR REPLACE INTO ingest_seq_gaps (device_id, gaps) VALUES (?, ?)",
+                         (device_id, pack_gaps(state.gaps)))
+        state.version += 1
+        return True
+
+    def check(self, conn: sqlite3.Connection, device_id: int, seq: int, boot=None) -> bool:
+        """
+        True if the packet is new. Must run inside the ingest's write
+        transaction (BEGIN IMMEDIATE), so no other worker can interleave.
+
+        Logic:
+        1. Common case: One UPDATE of the small per-device row, guarded by
+           its version; no read, and the gap list is not touched.
+        2. Gaps: The packed gap list is rewritten only when a range opens,
+           shrinks or is given up.
+        3. Conflict: If another worker moved the version (or a rolled back
+           transaction left this copy ahead), the state is reloaded and the
+           packet applied again.
+        """
+        with self.lock:
+            for attempt in (0, 1):
+                state = self.states.get(device_id)
+                if state is None or attempt:
+                    state = self.states[device_id] = self._load(conn, device_id)
+
+                gaps_changed = False
+                if boot is not None and boot != state.boot:
+                    gaps_changed = bool(state.gaps)
+                    state.restart(boot)
+                hwm = state.hwm
+                fresh = state.accept(seq)
+                # Gaps only change when a range opens (seq jumps ahead) or one is filled
+                gaps_changed = gaps_changed or seq > hwm + 1 or (fresh and seq <= hwm)
+                if self._write(conn, device_id, state, gaps_changed):
+                    return fresh
+            raise sqlite3.OperationalError(f"ingest_seq row for device {device_id} keeps changing")
+
+    def forget(self):
+        """Drops the in-memory copies; called when an ingest transaction rolls back."""
+        with self.lock:
+            self.states.clear()
+
+def gap_stats(conn: sqlite3.Connection, device_id=None) -> list:
+    """Per-device sequence statistics, read from the shared tables."""
+    where, args = ("WHERE s.device_id = ?", (device_id,)) if device_id is not None else ("", ())
+    rows = conn.execute(f"{SEQ_SELECT} {where} ORDER BY s.device_id", args).fetchall()
+    out = []
+    for row in rows:
+        state = _state_from_row(row)
+        stats = state.to_dict()
+        stats.update({"device_id": row["device_id"], "updated": row["updated"],
+                      "gaps": state.gaps[-20:]})
+        out.append(stats)
+    return out
+
+sequence_tracker = SequenceTracker()
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from shared.config import PROJECT_ROOT
+from services.data_services import (
+    open_db, aggregate_minutes, aggregate_hours, aggregate_days, prune_raw,
+    ensure_incremental_vacuum, incremental_vacuum, wal_manager
+)
+from services.detection_services import detector, store_events, last_seen_by_device
+
+# --- Budgeted Maintenance Scheduler ---
+
+TICK_SECONDS = 5
+VACUUM_STEP_PAGES = 256
+
+# Written by the leader after every tick, so any process can report status
+STATUS_PATH = os.path.join(PROJECT_ROOT, 'data', 'maintenance_status.json')
+
+class MaintenanceTask:
+    """
+    A periodic maintenance job.
+
+    'func' receives (conn, deadline) where deadline is a time.monotonic()
+    value; long-running tasks must check it and stop early so the write
+    lock is handed back to ingest.
+    """
+    def __init__(self, name, func, interval, budget, align_hour=False, once=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.budget = budget
+        self.align_hour = align_hour
+        self.once = once
+        self.next_run = datetime.now()
+        self.last_run = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+        self.runs = 0
+        self.failures = 0
+        self.over_budget = 0
+
+    def schedule_next(self, now: datetime):
+        if self.once:
+            self.next_run = None
+        elif self.align_hour:
+            self.next_run = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        else:
+            self.next_run = now + timedelta(seconds=self.interval)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_s": self.interval,
+            "budget_s": self.budget,
+            "next_run": self.next_run.strftime("%Y-%m-%d %H:%M:%S") if self.next_run else None,
+            "last_run": self.last_run.strftime("%Y-%m-%d %H:%M:%S") if self.last_run else None,
+            "last_duration_s": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+            "over_budget": self.over_budget,
+        }
+
+class MaintenanceScheduler:
+    """
+    Runs due tasks one at a time on a dedicated connection.
+
+    Logic:
+    1. Order: Tasks run in registration order, so aggregation always
+       precedes pruning within the same tick.
+    2. Budgets: Each task gets a deadline and works in bounded steps that
+       stop once it passes; a task that returns {"more": True} runs again on
+       the next tick. Overruns are counted so slow steps are visible in the
+       status API.
+    3. Isolation: A failing task is recorded and rescheduled; it never stops
+       the loop or the other tasks.
+    """
+    def __init__(self):
+        self.tasks = []
+        self.lock = threading.Lock()
+        self.started_at = None
+
+    def add(self, task: MaintenanceTask):
+        self.tasks.append(task)
+        return task
+
+    def run_due(self, conn):
+        for task in self.tasks:
+            now = datetime.now()
+            if task.next_run is None or task.next_run > now:
+                continue
+
+            start = time.monotonic()
+            more = False
+            try:
+                task.last_result = task.func(conn, start + task.budget)
+                task.last_error = None
+                more = isinstance(task.last_result, dict) and task.last_result.get("more", False)
+            except Exception as e:
+                task.failures += 1
+                task.last_error = str(e)
+                print(f"Maintenance task '{task.name}' failed at {now}: {e}")
+            duration = time.monotonic() - start
+
+            with self.lock:
+                task.runs += 1
+                task.last_run = now
+                task.last_duration = duration
+                if duration > task.budget:
+                    task.over_budget += 1
+                task.schedule_next(datetime.now())
+                if more:
+                    # Stopped at its deadline: continue on the next tick, after ingest had the lock
+                    task.next_run = datetime.now() + timedelta(seconds=TICK_SECONDS)
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "started_at": self.started_at.strftime("%Y-%m-%d %H:%M:%S") if self.started_at else None,
+                "tasks": [t.to_dict() for t in self.tasks],
+            }
+
+    def publish(self, path: str = STATUS_PATH):
+        """
+        Writes task status and WAL metrics to 'path' for the other processes.
+        Written to a temporary file and renamed, so readers never see half a file.
+        """
+        status = dict(self.status(), wal=wal_manager.metrics(),
+                      updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp, path)
+
+    def run_forever(self):
+        self.started_at = datetime.now()
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = open_db()
+                self.run_due(conn)
+                self.publish()
+            except Exception as e:
+                print(f"Database maintenance failure at {datetime.now()}: {e}")
+                if conn:
+                    conn.close()
+                conn = None
+            time.sleep(TICK_SECONDS)
+
+def published_status(path: str = STATUS_PATH):
+    """Status last written by the leader (see publish), or None if there is none yet."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Task bodies
+
+def _aggregate_minutes(conn, deadline):
+    return {"more": not aggregate_minutes(conn, deadline)}
+
+def _aggregate(conn, deadline):
+    if not aggregate_hours(conn, deadline):
+        return {"more": True}
+    # Days are built from complete hours only
+    aggregate_days(conn)
+    return {"more": False}
+
+def _prune(conn, deadline):
+    return prune_raw(conn, deadline)
+
+def _migrate_auto_vacuum(conn, deadline):
+    return {"migrated": ensure_incremental_vacuum(conn)}
+
+def _incremental_vacuum(conn, deadline):
+    return {"pages_freed": incremental_vacuum(conn, VACUUM_STEP_PAGES, deadline)}
+
+def _wal_checkpoint(conn, deadline):
+    return wal_manager.checkpoint(conn)
+
+def _detect_dropouts(conn, deadline):
+    events = detector.check_dropouts(conn, last_seen_by_device(conn))
+    store_events(conn, events)
+    conn.commit()
+    return {"events": len(events)}
+
+scheduler = MaintenanceScheduler()
+scheduler.add(MaintenanceTask("migrate_auto_vacuum", _migrate_auto_vacuum, interval=0, budget=60, once=True))
+scheduler.add(MaintenanceTask("aggregate_minutes", _aggregate_minutes, interval=60, budget=5))
+scheduler.add(MaintenanceTask("aggregate", _aggregate, interval=3600, budget=30, align_hour=True))
+scheduler.add(MaintenanceTask("prune", _prune, interval=3600, budget=5, align_hour=True))
+scheduler.add(MaintenanceTask("incremental_vacuum", _incremental_vacuum, interval=600, budget=0.5))
+scheduler.add(MaintenanceTask("detect_dropouts", _detect_dropouts, interval=15, budget=1))
+scheduler.add(MaintenanceTask("wal_checkpoint", _wal_checkpoint, interval=10, budget=1))
+
+def db_manager():
+    """
+    Background maintenance entry point.
+    Every task runs immediately upon startup, then on its own schedule.
+    """
+    scheduler.run_forever()
@@ -0,0 +1,259 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from shared.config import STATS_CACHE_MAX_BYTES
+from services.data_services import (
+    TIERS, read_chunked, partitions_for_range, union_source, query_cache
+)
+from services.archive_services import archived_history
+
+# --- Vectorized statistics over the history tiers ---
+#
+# A request is split into calendar-month chunks. Each chunk is read with
+# read_chunked() straight into NumPy arrays (int64 naive epoch seconds and
+# float64 values), so no more than READ_CHUNK_ROWS rows exist as Python
+# objects at a time. Months that can no longer change are kept in an
+# in-memory array cache, so repeated year-long requests only re-read the
+# current month.
+
+METRICS = {
+    # metric: (raw column, rollup column)
+    "temp": ("temp", "temp_avg"),
+    "hum": ("hum", "hum_avg"),
+    "lux": ("lux", "lux_avg"),
+    "gas_pct": ("gas_pct", "gas_avg"),
+    "press": ("press", "press_avg"),
+}
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+MAX_GAP_FACTOR = 3          # Degree-hours: gaps above N x tier resolution are not integrated
+MIN_RAW_STEP = 60           # Correlation buckets for the raw tier
+
+class ArrayCache:
+    """Byte-bounded LRU of closed (tier, device, metric, month) arrays."""
+    def __init__(self, max_bytes=STATS_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, ts: np.ndarray, values: np.ndarray):
+        nbytes = ts.nbytes + values.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[0].nbytes + old[1].nbytes
+            self.entries[key] = (ts, values)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (old_ts, old_values) = self.entries.popitem(last=False)
+                self.size -= old_ts.nbytes + old_values.nbytes
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+array_cache = ArrayCache()
+
+def to_epoch(labels) -> np.ndarray:
+    """Naive time labels -> int64 seconds (same convention as the archive)."""
+    return np.array(labels, dtype="datetime64[s]").astype(np.int64)
+
+def month_chunks(start: str, end: str) -> list:
+    """Splits [start, end] into (chunk_start, chunk_end) labels on month boundaries."""
+    chunks = []
+    cursor = datetime.fromisoformat(start)
+    last = datetime.fromisoformat(end)
+    while cursor <= last:
+        nxt = (cursor.replace(day=1, hour=0, minute=0, second=0) + timedelta(days=32)).replace(day=1)
+        chunk_end = min(last, nxt - timedelta(seconds=1))
+        chunks.append((cursor.strftime("%Y-%m-%d %H:%M:%S"), chunk_end.strftime("%Y-%m-%d %H:%M:%S")))
+        cursor = nxt
+    return chunks
+
+def _read_chunk(conn: sqlite3.Connection, tier: str, device_id: int, metric: str, start: str, end: str):
+    raw_col, rollup_col = METRICS[metric]
+    if tier == "raw":
+        source = union_source(partitions_for_range(conn, start, end))
+        columns, time_col, keys = f"id, date_time, {raw_col} AS value", "date_time", ("date_time", "id")
+    else:
+        source = TIERS[tier][0]
+        columns, time_col, keys = f"time_label, {rollup_col} AS value", "time_label", ("time_label",)
+
+    ts_parts, value_parts = [], []
+    archived = archived_history(conn, tier, device_id, start, end)
+    if archived:
+        ts_parts.append(to_epoch([r["date_time"] for r in archived]))
+        value_parts.append(np.array([r[metric] for r in archived], dtype=np.float64))
+
+    where = f"device_id=? AND {time_col} BETWEEN ? AND ?"
+    for rows in read_chunked(conn, source, columns, where, (device_id, start, end), keys):
+        ts_parts.append(to_epoch([r[time_col] for r in rows]))
+        value_parts.append(np.array([r["value"] for r in rows], dtype=np.float64))
+
+    if not ts_parts:
+        return np.empty(0, np.int64), np.empty(0, np.float64)
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+def load_series(conn: sqlite3.Connection, tier: str, device_id: int, metric: str, start: str, end: str):
+    """Returns (ts, values) arrays for one device, assembled month by month."""
+    mark = query_cache.watermark(conn, tier)
+    ts_parts, value_parts = [], []
+    for chunk_start, chunk_end in month_chunks(start, end):
+        key = (tier, device_id, metric, chunk_start, chunk_end)
+        cached = array_cache.get(key)
+        if cached is None:
+            cached = _read_chunk(conn, tier, device_id, metric, chunk_start, chunk_end)
+            if mark and chunk_end < mark:
+                array_cache.put(key, *cached)
+        ts_parts.append(cached[0])
+        value_parts.append(cached[1])
+    ts = np.concatenate(ts_parts) if ts_parts else np.empty(0, np.int64)
+    values = np.concatenate(value_parts) if value_parts else np.empty(0, np.float64)
+    # NULL readings arrive as NaN; they carry no information for any statistic
+    keep = np.isfinite(values)
+    return ts[keep], values[keep]
+
+# --- Statistics ---
+
+def summary(values: np.ndarray) -> dict:
+    if not values.size:
+        return {"count": 0}
+    pct = np.percentile(values, PERCENTILES)
+    out = {
+        "count": int(values.size),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+    }
+    out.update({f"p{p}": float(v) for p, v in zip(PERCENTILES, pct)})
+    return out
+
+def histogram(values: np.ndarray, bins: int, value_range=None) -> dict:
+    if not values.size:
+        return {"edges": [], "counts": []}
+    counts, edges = np.histogram(values, bins=bins, range=value_range)
+    return {"edges": edges.round(4).tolist(), "counts": counts.tolist()}
+
+def hour_profile(ts: np.ndarray, values: np.ndarray) -> dict:
+    """Mean, min and max per hour of day (0-23)."""
+    hours = (ts // 3600) % 24
+    counts = np.bincount(hours, minlength=24)
+    sums = np.bincount(hours, weights=values, minlength=24)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    mins = np.full(24, np.inf)
+    maxs = np.full(24, -np.inf)
+    np.minimum.at(mins, hours, values)
+    np.maximum.at(maxs, hours, values)
+    empty = counts == 0
+
+    def clean(arr):
+        return [None if e else round(float(v), 4) for v, e in zip(arr, empty)]
+    return {"count": counts.tolist(), "mean": clean(means), "min": clean(mins), "max": clean(maxs)}
+
+def degree_hours(ts: np.ndarray, values: np.ndarray, base: float, resolution: int) -> dict:
+    """
+    Time integral of the excursion above and below 'base', in unit-hours.
+
+    Each sample is held until the next one (left Riemann sum); gaps longer
+    than MAX_GAP_FACTOR x the tier resolution are outages and contribute nothing.
+    """
+    if ts.size < 2:
+        return {"base": base, "above": 0.0, "below": 0.0, "covered_hours": 0.0}
+    dt = np.diff(ts).astype(np.float64)
+    dt[dt > MAX_GAP_FACTOR * max(resolution, MIN_RAW_STEP)] = 0.0
+    excess = values[:-1] - base
+    return {
+        "base": base,
+        "above": round(float(np.sum(np.clip(excess, 0, None) * dt)) / 3600, 4),
+        "below": round(float(np.sum(np.clip(-excess, 0, None) * dt)) / 3600, 4),
+        "covered_hours": round(float(dt.sum()) / 3600, 4),
+    }
+
+def bucket_means(ts: np.ndarray, values: np.ndarray, step: int):
+    """Averages a series on a regular grid; returns (bucket ids, means)."""
+    buckets = ts // step
+    ids, inverse = np.unique(buckets, return_inverse=True)
+    means = np.bincount(inverse, weights=values) / np.bincount(inverse)
+    return ids, means
+
+def correlation(series: dict, step: int) -> dict:
+    """
+    Pearson correlation between every device pair, on the time buckets both
+    devices reported in.
+    """
+    gridded = {dev: bucket_means(ts, values, step) for dev, (ts, values) in series.items() if ts.size}
+    devices = sorted(gridded)
+    matrix, overlap = [], []
+    for a in devices:
+        row, row_n = [], []
+        for b in devices:
+            common, ia, ib = np.intersect1d(gridded[a][0], gridded[b][0], return_indices=True)
+            if common.size < 3:
+                row.append(None)
+            else:
+                x, y = gridded[a][1][ia], gridded[b][1][ib]
+                r = np.corrcoef(x, y)[0, 1] if x.std() and y.std() else np.nan
+                row.append(None if np.isnan(r) else round(float(r), 4))
+            row_n.append(int(common.size))
+        matrix.append(row)
+        overlap.append(row_n)
+    return {"devices": devices, "step_s": step, "r": matrix, "overlap": overlap}
+
+STATS = ("summary", "histogram", "profile", "degree_hours", "correlation")
+
+def compute_stats(conn: sqlite3.Connection, tier: str, devices: list, metric: str, start: str, end: str,
+                  wanted=STATS, bins: int = 20, base: float = 10.0) -> dict:
+    """
+    Runs the requested statistics for every device.
+
+    Logic:
+    1. Load: One (ts, values) array pair per device via load_series().
+    2. Per device: summary/percentiles, histogram, hour-of-day profile and
+       degree-hours are computed independently.
+    3. Cross device: Histograms share one value range so they are
+       comparable; correlation aligns devices on a common time grid.
+    """
+    resolution = TIERS[tier][1]
+    series = {dev: load_series(conn, tier, dev, metric, start, end) for dev in devices}
+
+    value_range = None
+    non_empty = [v for _, v in series.values() if v.size]
+    if non_empty:
+        lo = min(float(v.min()) for v in non_empty)
+        hi = max(float(v.max()) for v in non_empty)
+        value_range = (lo, hi if hi > lo else lo + 1.0)
+
+    result = {"tier": tier, "metric": metric, "start": start, "end": end, "devices": {}}
+    for dev, (ts, values) in series.items():
+        out = {}
+        if "summary" in wanted:
+            out["summary"] = summary(values)
+        if "histogram" in wanted:
+            out["histogram"] = histogram(values, bins, value_range)
+        if "profile" in wanted:
+            out["profile"] = hour_profile(ts, values)
+        if "degree_hours" in wanted:
+            out["degree_hours"] = degree_hours(ts, values, base, resolution)
+        result["devices"][str(dev)] = out
+
+    if "correlation" in wanted and len(devices) > 1:
+        result["correlation"] = correlation(series, max(resolution, MIN_RAW_STEP))
+    return result
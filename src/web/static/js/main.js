@@ -111,7 +111,8 @@ let isLightMode = localStorage.getItem('theme') === 'light';
 // Fonction pour mettre à jour la vidéo de fond
 function updateVideoBackground(isLight) {
     if (!bgVideo) return;
-    const newSrc = isLight ? '/static/videos/greensatlightmode.mp4' : '/static/videos/greensatnightmode.mp4';
+    // Fingerprinted URLs come from the template (see asset_url)
+    const newSrc = isLight ? bgVideo.dataset.light : bgVideo.dataset.night;
     // Évite de recharger la vidéo si c'est déjà la bonne
     if (!bgVideo.src.includes(newSrc)) {
         bgVideo.src = newSrc;
@@ -413,46 +414,50 @@ window.switchChart = function(mode) {
 }
 
 let chartHistory = { labels: [], temp: [], hum: [], gas: [], press: [], lux: [] };
+/* Delta cursor returned by /api/history (X-GreenSat-Cursor) */
+let historyCursor = null;
+let historyRange = null;
+
+function formatPointLabel(rawDate) {
+    if (!rawDate) return "---";
+    const dtStr = String(rawDate);
+    if (viewMode === 'day') {
+        const timeMatch = dtStr.match(/(\d{2}:\d{2})/);
+        return timeMatch ? timeMatch[1] : dtStr;
+    }
+    const dateObj = new Date(dtStr);
+    if (isNaN(dateObj)) return "---";
+    if (viewMode === 'week') return `${dateObj.getDate()}/${dateObj.getMonth()+1} ${dateObj.getHours()}h`;
+    if (viewMode === 'month') return `${dateObj.getDate()}/${dateObj.getMonth()+1}`;
+    if (viewMode === 'year') return `${dateObj.getMonth()+1}/${dateObj.getFullYear()}`;
+    return "---";
+}
+
+function pushHistoryPoint(d) {
+    if (!d) return;
+    chartHistory.labels.push(formatPointLabel(d.date_time || d.time_label || ""));
+    chartHistory.temp.push(d.temp ?? 0);
+    chartHistory.hum.push(d.hum ?? 0);
+    chartHistory.gas.push(d.gas_pct ?? d.gas ?? 0);
+    chartHistory.press.push(d.press ?? 0);
+    chartHistory.lux.push(d.lux ?? 0);
+}
 
 async function loadHistoryData() {
     const range = getDateRange();
     const url = `/api/history?start=${range.start}&end=${range.end}&mode=${viewMode}&sonde=${currentSondeId}`;
+    historyCursor = null;
+    historyRange = range;
 
     try {
         const response = await fetch(url);
         if (!response.ok) return;
         const data = await response.json();
+        if (historyRange !== range) return; /* A newer load superseded this one */
         
         chartHistory = { labels: [], temp: [], hum: [], gas: [], press: [], lux: [] };
-        
-        data.forEach(d => {
-            if (!d) return;
-
-            let label = "---";
-            const rawDate = d.date_time || d.time_label || "";
-
-            if (rawDate) {
-                const dtStr = String(rawDate);
-                if (viewMode === 'day') {
-                    const timeMatch = dtStr.match(/(\d{2}:\d{2})/);
-                    label = timeMatch ? timeMatch[1] : dtStr;
-                } else {
-                    const dateObj = new Date(dtStr);
-                    if (!isNaN(dateObj)) {
-                        if (viewMode === 'week') label = `${dateObj.getDate()}/${dateObj.getMonth()+1} ${dateObj.getHours()}h`;
-                        else if (viewMode === 'month') label = `${dateObj.getDate()}/${dateObj.getMonth()+1}`;
-                        else if (viewMode === 'year') label = `${dateObj.getMonth()+1}/${dateObj.getFullYear()}`;
-                    }
-                }
-            }
-
-            chartHistory.labels.push(label);
-            chartHistory.temp.push(d.temp ?? 0);
-            chartHistory.hum.push(d.hum ?? 0);
-            chartHistory.gas.push(d.gas_pct ?? d.gas ?? 0);
-            chartHistory.press.push(d.press ?? 0);
-            chartHistory.lux.push(d.lux ?? 0);
-        });
+        data.forEach(pushHistoryPoint);
+        historyCursor = response.headers.get('X-GreenSat-Cursor');
         
         updateChartData();
         logSystem(`DATA SYNC: ${data.length} PTS`);
@@ -462,6 +467,27 @@ async function loadHistoryData() {
     }
 }
 
+/* Appends only the points newer than historyCursor (live day view) */
+async function loadHistoryDelta() {
+    const range = historyRange;
+    if (!range || !historyCursor) return;
+    const url = `/api/history?start=${range.start}&end=${range.end}&mode=${viewMode}&sonde=${currentSondeId}&since=${encodeURIComponent(historyCursor)}`;
+
+    try {
+        const response = await fetch(url);
+        if (!response.ok) return;
+        const data = await response.json();
+        if (historyRange !== range) return;
+
+        historyCursor = response.headers.get('X-GreenSat-Cursor') || historyCursor;
+        if (data.length === 0) return;
+        data.forEach(pushHistoryPoint);
+        updateChartData();
+    } catch(e) {
+        console.error("History Delta Error", e);
+    }
+}
+
 function updateChartData() {
     if(!mainChart) return;
     mainChart.options.animation = false;
@@ -565,22 +591,7 @@ async function fetchData() {
 
         const isToday = new Date().toDateString() === currentReferenceDate.toDateString();
         if (viewMode === 'day' && isToday) {
-            const timeLabel = data.date_time.split(' ')[1].substring(0, 5);
-            if (chartHistory.labels[chartHistory.labels.length - 1] !== timeLabel) {
-                chartHistory.labels.push(timeLabel);
-                chartHistory.temp.push(data.temp);
-                chartHistory.hum.push(data.hum);
-                chartHistory.gas.push(data.gas_pct);
-                chartHistory.press.push(data.press);
-                chartHistory.lux.push(data.lux);
-                
-                if (chartHistory.labels.length > 200) { 
-                    chartHistory.labels.shift();
-                    chartHistory.temp.shift(); chartHistory.hum.shift();
-                    chartHistory.gas.shift(); chartHistory.press.shift(); chartHistory.lux.shift();
-                }
-                updateChartData();
-            }
+            await loadHistoryDelta();
         }
 
     } catch (e) {
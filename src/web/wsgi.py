@@ -0,0 +1,26 @@
+"""
+Production WSGI entry point.
+
+    gunicorn wsgi:app            (Linux / Raspberry Pi, reads gunicorn.conf.py)
+    python serve.py              (any platform)
+
+The schema is ensured once by the launcher, not by every worker, and
+db_manager runs in exactly one process: the holder of the leader lock.
+"""
+from app import app
+from services.data_services import open_db, hot_window
+from services.maintenance import db_manager
+from shared.leader import start_leader_thread
+import os
+
+# Followers keep retrying, so maintenance moves to another worker if the
+# leader dies. GREENSAT_MAINTENANCE=off leaves it to run_maintenance.py.
+if os.environ.get("GREENSAT_MAINTENANCE", "on") != "off":
+    start_leader_thread(db_manager)
+
+# Each worker warm-loads its own hot window (recent raw samples)
+try:
+    with open_db() as conn:
+        hot_window.warm(conn)
+except Exception as e:
+    print(f"Hot window warm load failed: {e}")
@@ -0,0 +1,22 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ("src", os.path.join("src", "web"), os.path.join("src", "raspberry", "onboard")):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+from shared.raw_store import ensure_raw_schema, forget_partitions
+
+
+@pytest.fixture
+def raw_conn():
+    """In-memory database with partitioned raw storage; the partition cache starts empty."""
+    forget_partitions()
+    conn = sqlite3.connect(":memory:")
+    ensure_raw_schema(conn)
+    yield conn
+    conn.close()
+    forget_partitions()
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from gps import NMEAParser
+
+RECORDING = os.path.join(os.path.dirname(__file__), "fixtures", "gps_recording.nmea")
+
+
+def recording() -> bytes:
+    with open(RECORDING, "rb") as f:
+        return f.read()
+
+
+def feed_in_chunks(parser, data, size):
+    for i in range(0, len(data), size):
+        parser.feed(data[i:i + size])
+
+
+@pytest.mark.parametrize("size", [1, 7, 32, 4096])
+def test_recorded_stream(size):
+    # Chunk sizes split sentences at every possible point, like a UART read
+    parser = NMEAParser()
+    feed_in_chunks(parser, recording(), size)
+
+    fix = parser.fix()
+    assert fix["lat"] == pytest.approx(48.8521667)
+    assert fix["lon"] == pytest.approx(2.3595)
+    assert fix["alt"] == 36.1
+    assert (fix["fix"], fix["sats"], fix["hdop"]) == (2, 10, 0.7)
+    assert (fix["mode"], fix["pdop"], fix["vdop"]) == (3, 1.8, 1.5)
+    assert fix["valid"] and fix["speed_kn"] == 1.2 and fix["course"] == 90.0
+    assert (fix["utc"], fix["date"]) == ("123522.00", "191026")
+    stats = parser.stats
+    # GPGGA (no fix), GPGGA, GPRMC, GPGSA, GNGGA, GNRMC; GSV ignored; one corrupted GGA
+    assert (stats["sentences"], stats["bad_checksum"], stats["ignored"]) == (6, 1, 1)
+    # The sentence cut off by a reset is malformed. The 200-byte noise line is
+    # dropped as an overflow while it is buffered (small chunks) or as
+    # malformed once its newline arrives, depending on the chunk size
+    assert stats["malformed"] >= 1 and stats["malformed"] + stats["overflow"] >= 2
+    assert parser.buf == b""
+
+
+def test_bad_checksum_does_not_move_the_fix():
+    lines = recording().splitlines(keepends=True)
+    parser = NMEAParser()
+    parser.feed(b"".join(lines[:5]))
+    before = parser.fix()
+    # The next sentence claims 0,0 at 999 m with a corrupted checksum
+    assert parser.feed(lines[5]) == 0
+    assert parser.fix() == before
+    assert before["lat"] == pytest.approx(48.8520567)
+    assert before["lon"] == pytest.approx(2.3594633)
+    assert before["alt"] == 35.4
+
+
+def test_no_position_before_first_fix():
+    parser = NMEAParser()
+    parser.feed(recording().splitlines(keepends=True)[0])
+    fix = parser.fix()
+    assert (fix["lat"], fix["lon"], fix["fix"], fix["sats"]) == (None, None, 0, 3)
+
+
+def test_overflow_resyncs_on_next_sentence():
+    line = recording().splitlines(keepends=True)[2]
+    parser = NMEAParser()
+    parser.feed(b"\x00\xff" * 80)
+    assert parser.stats["overflow"] == 1 and parser.buf == b""
+    assert parser.feed(line) == 1
+    assert parser.fix()["sats"] == 8
@@ -0,0 +1,42 @@
+from shared.raw_store import RAW_VIEW, RAW_SEQ_TABLE, ensure_raw_seq, insert_raw, list_partitions
+
+
+def row(label, device_id=1):
+    return (label, 20.0, 50.0, 100.0, 10.0, 1013.0, device_id)
+
+
+def test_ids_stay_unique_across_midnight(raw_conn):
+    # Today's reading first, then a late one routed to yesterday's partition
+    first, = insert_raw(raw_conn, [row("2026-10-19 00:00:00")])
+    raw_conn.commit()
+    late, = insert_raw(raw_conn, [row("2026-10-18 23:59:55")])
+    raw_conn.commit()
+    after = insert_raw(raw_conn, [row("2026-10-19 00:00:05"), row("2026-10-18 23:59:58")])
+    raw_conn.commit()
+
+    ids = [r[0] for r in raw_conn.execute(f"SELECT id FROM {RAW_VIEW}")]
+    assert len(ids) == len(set(ids)) == 4
+    # Ids follow insertion order, not the partition a row lands in
+    assert first < late < after[0] < after[1]
+    assert {"live_data_p20261018", "live_data_p20261019"} <= set(list_partitions(raw_conn))
+
+
+def test_rolled_back_insert_does_not_consume_ids(raw_conn):
+    insert_raw(raw_conn, [row("2026-10-19 08:00:00")])
+    raw_conn.commit()
+    insert_raw(raw_conn, [row("2026-10-19 08:00:01")])
+    raw_conn.rollback()
+    nxt, = insert_raw(raw_conn, [row("2026-10-19 08:00:02")])
+    raw_conn.commit()
+    assert nxt == 2
+
+
+def test_counter_is_seeded_past_existing_ids(raw_conn):
+    insert_raw(raw_conn, [row("2026-10-19 08:00:00"), row("2026-10-19 08:00:01")])
+    raw_conn.commit()
+    # A database from before the counter existed: ids only live in sqlite_sequence
+    raw_conn.execute(f"DROP TABLE {RAW_SEQ_TABLE}")
+    ensure_raw_seq(raw_conn)
+    nxt, = insert_raw(raw_conn, [row("2026-10-17 12:00:00")])
+    raw_conn.commit()
+    assert nxt == 3